@@ -0,0 +1,38 @@
+# Runs the streaming profile API on its own, without the Telegram bot:
+#
+#   python api.py
+#   curl "http://127.0.0.1:8700/profiles?locale=de&count=100000" > profiles.ndjson
+#
+# main.py serves the same API alongside the bot when PROFILE_API_ENABLED is set.
+import asyncio
+import signal
+
+from mimesis.enums import Locale
+
+from config.settings import WARM_LOCALES
+from logs.logger import logger
+from utils.engine import generation_engine
+from utils.profile_api import profile_api
+from utils.uniqueness import unique_filters
+
+
+async def main():
+    generation_engine.start(
+        [Locale(value) for value in WARM_LOCALES if value in Locale._value2member_map_]
+    )
+    await profile_api.start()
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    logger.info("Profile API started")
+    try:
+        await stopped.wait()
+    finally:
+        await profile_api.stop()
+        await unique_filters.close()
+        generation_engine.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+# Per-profile render cost for every output format.
+# Run from the repository root: python -m benchmarks.bench_render [count]
+import sys
+import timeit
+
+from mimesis.enums import Locale
+
+from utils.details_generator import build_details
+from utils.renderer import RENDER_FORMATS, render_profile, split_message
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    profiles = [build_details(locale) for locale in (Locale.EN, Locale.JA, Locale.RU)]
+
+    print(f"{'format':<10} {'us/profile':>12} {'chars':>8}")
+    for output_format in RENDER_FORMATS:
+        seconds = timeit.timeit(
+            lambda: [render_profile(details, output_format) for details in profiles],
+            number=count // len(profiles),
+        )
+        per_profile = seconds / (count // len(profiles) * len(profiles)) * 1e6
+        size = len(render_profile(profiles[0], output_format))
+        print(f"{output_format:<10} {per_profile:>12.2f} {size:>8}")
+
+    page = "".join(render_profile(details) for details in profiles * 50)
+    seconds = timeit.timeit(lambda: split_message(page), number=1000)
+    print(f"split_message of {len(page)} chars into {len(split_message(page))}: "
+          f"{seconds * 1e3:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
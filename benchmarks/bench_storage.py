@@ -0,0 +1,138 @@
+# Compares the history storage backends on the operations the bot performs:
+# single inserts, write-behind batches, history pages and export scans.
+# SQLite runs against a temporary file; Mongo needs MONGO_URI and uses a
+# scratch collection that is dropped afterwards. Run from the repository root:
+#
+#   python -m benchmarks.bench_storage --backends sqlite,mongo --documents 50000
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from config.settings import WRITE_BATCH_SIZE
+from utils.database import decode_history_key, encode_history_key
+from utils.storage import MongoStorage, SQLiteStorage
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def make_documents(count: int, users: int) -> List[Dict]:
+    started = datetime(2024, 1, 1)
+    return [
+        {
+            "user_id": random.randrange(users),
+            "username": "bench",
+            "l": "en",
+            "s": random.getrandbits(63),
+            "v": 2,
+            "y": 2024,
+            "timestamp": started + timedelta(seconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+async def timed_calls(calls) -> Dict[str, float]:
+    timings = []
+    for call in calls:
+        started = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - started)
+    total = sum(timings)
+    return {
+        "per_second": len(timings) / total if total else 0.0,
+        "p50_ms": percentile(timings, 0.50) * 1e3,
+        "p99_ms": percentile(timings, 0.99) * 1e3,
+    }
+
+
+async def bench(storage, documents: List[Dict], users: int, page_size: int) -> Dict[str, Dict[str, float]]:
+    await storage.open()
+    results = {}
+
+    singles = documents[:1000]
+    results["insert"] = await timed_calls(
+        [lambda document=document: storage.insert(dict(document)) for document in singles]
+    )
+
+    batches = [documents[i : i + WRITE_BATCH_SIZE] for i in range(len(singles), len(documents), WRITE_BATCH_SIZE)]
+    results["insert_many"] = await timed_calls(
+        [lambda batch=batch: storage.insert_many([dict(document) for document in batch]) for batch in batches]
+    )
+    results["insert_many"]["documents_per_second"] = results["insert_many"]["per_second"] * WRITE_BATCH_SIZE
+
+    async def page(user_id: int):
+        first = await storage.history_page(user_id, page_size + 1)
+        if len(first) > page_size:
+            key = decode_history_key(encode_history_key(first[page_size - 1]))
+            await storage.history_page(user_id, page_size + 1, before=key)
+
+    results["history_page"] = await timed_calls(
+        [lambda user_id=random.randrange(users): page(user_id) for _ in range(500)]
+    )
+
+    async def export(user_id: int):
+        async for _ in storage.export_batches(user_id, None, None, 500):
+            pass
+
+    results["export"] = await timed_calls([lambda user_id=user_id: export(user_id) for user_id in range(min(users, 50))])
+    results["export"]["entries_per_second"] = results["export"]["per_second"] * len(documents) / users
+    return results
+
+
+async def run(args) -> Dict[str, Dict[str, Dict[str, float]]]:
+    random.seed(args.seed)
+    documents = make_documents(args.documents, args.users)
+    results = {}
+    for backend in args.backends.split(","):
+        if backend == "sqlite":
+            storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(prefix="bench_storage_"), "history.db"))
+        else:
+            storage = MongoStorage("bench_history")
+            try:
+                await storage.collection.drop()
+            except Exception as e:
+                print(f"mongo: skipped, server not reachable ({e.__class__.__name__})")
+                continue
+        try:
+            results[backend] = await bench(storage, documents, args.users, args.page_size)
+        finally:
+            if backend == "mongo":
+                await storage.collection.drop()
+            await storage.close()
+        for operation, figures in results[backend].items():
+            rows = figures.get("documents_per_second") or figures.get("entries_per_second")
+            print(
+                f"{backend:<7} {operation:<13} {figures['per_second']:>9.0f} ops/s "
+                f"p50 {figures['p50_ms']:>8.3f}ms p99 {figures['p99_ms']:>8.3f}ms"
+                + (f" ({rows:.0f} documents/s)" if rows else "")
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History storage backend benchmark")
+    parser.add_argument("--backends", default="sqlite,mongo", help="Comma-separated: sqlite, mongo")
+    parser.add_argument("--documents", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# Offline per-locale benchmarks for generation, rendering and serialisation.
+# Needs neither Telegram nor Mongo. Run from the repository root:
+#
+#   python -m benchmarks.bench_suite --save            # record a baseline
+#   python -m benchmarks.bench_suite --threshold 0.2   # compare against it
+#
+# Exits with status 1 when any locale/stage is slower than the baseline by
+# more than the threshold (p50 latency or throughput).
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import bson
+import mimesis
+
+from handlers.commands import LOCALES
+from utils.details_generator import build_details
+from utils.provider_cache import current_registry
+from utils.renderer import render_profile
+
+DEFAULT_BASELINE = "benchmarks/baselines/default.json"
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(operation: Callable[[int], object], iterations: int) -> Dict[str, float]:
+    timings = []
+    for i in range(iterations):
+        started = time.perf_counter_ns()
+        operation(i)
+        timings.append((time.perf_counter_ns() - started) / 1e3)
+
+    # Allocation figures come from a separate pass; tracemalloc would
+    # distort the timings above.
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(min(iterations, 100)):
+        operation(i)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+
+    total_seconds = sum(timings) / 1e6
+    return {
+        "per_second": iterations / total_seconds if total_seconds else 0.0,
+        "p50_us": percentile(timings, 0.50),
+        "p99_us": percentile(timings, 0.99),
+        "retained_bytes": allocated,
+        "peak_bytes": peak,
+    }
+
+
+def run(locales, iterations: int, seed: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    results = {}
+    for locale in locales:
+        random.seed(seed)
+        for provider in current_registry().get(locale):
+            provider.reseed(seed)
+        # Warm-up, so dataset loading is not counted as generation
+        profiles = [build_details(locale) for _ in range(min(iterations, 50))]
+        document = {"user_id": 1, "username": "bench", "details": profiles[0], "timestamp": datetime(2024, 1, 1)}
+
+        results[locale.value] = {
+            "generation": measure(lambda i: build_details(locale), iterations),
+            "rendering": measure(lambda i: render_profile(profiles[i % len(profiles)]), iterations),
+            "serialisation": measure(
+                lambda i: (json.dumps(profiles[i % len(profiles)], ensure_ascii=False), bson.encode(document)),
+                iterations,
+            ),
+        }
+        generation = results[locale.value]["generation"]
+        print(
+            f"{locale.value:<6} generation {generation['per_second']:>9.0f}/s "
+            f"p50 {generation['p50_us']:>8.1f}us p99 {generation['p99_us']:>8.1f}us "
+            f"rendering p50 {results[locale.value]['rendering']['p50_us']:>6.1f}us "
+            f"serialisation p50 {results[locale.value]['serialisation']['p50_us']:>6.1f}us"
+        )
+    return results
+
+
+def compare(results, baseline, threshold: float) -> List[str]:
+    regressions = []
+    for locale, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(locale, {}).get(stage)
+            if previous is None:
+                continue
+            if current["p50_us"] > previous["p50_us"] * (1 + threshold):
+                regressions.append(
+                    f"{locale} {stage}: p50 {previous['p50_us']:.1f}us -> {current['p50_us']:.1f}us"
+                )
+            if current["per_second"] < previous["per_second"] * (1 - threshold):
+                regressions.append(
+                    f"{locale} {stage}: {previous['per_second']:.0f}/s -> {current['per_second']:.0f}/s"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-locale generation, rendering and serialisation benchmarks")
+    parser.add_argument("--locales", help="Comma-separated locale codes (default: all in LOCALES)")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    locales = list(LOCALES.values())
+    if args.locales:
+        wanted = set(args.locales.split(","))
+        locales = [locale for locale in locales if locale.value in wanted]
+
+    results = run(locales, args.iterations, args.seed)
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "mimesis": mimesis.__version__,
+            "machine": platform.machine(),
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --save first")
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+# End-to-end load simulator: drives the real handlers in handlers/commands.py
+# with synthetic updates from thousands of virtual users, against an
+# in-memory Telegram client and Mongo stand-in with injected latency.
+#
+#   python -m benchmarks.load_sim --users 5000 --pattern poisson --rate 200 --duration 60
+#   python -m benchmarks.load_sim --pattern burst --burst-size 500 --burst-every 10
+#   python -m benchmarks.load_sim --pattern ramp --rate 10 --peak-rate 800 --duration 120
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set
+
+from bson import ObjectId
+
+log = logging.getLogger("load_sim")
+_message_ids = itertools.count(1)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * resource.getpagesize()
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+class FakeMessage:
+    # Stands in for pyrogram.types.Message: every call that would reach
+    # Telegram sleeps for the configured latency instead.
+
+    def __init__(self, sim: "Simulation", user, text: str = ""):
+        self.sim = sim
+        self.id = next(_message_ids)
+        self.from_user = user
+        self.chat = SimpleNamespace(id=user.id)
+        self.text = text
+        self.command = text.lstrip("/").split() if text.startswith("/") else []
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        await self.sim.telegram_call()
+        return FakeMessage(self.sim, self.from_user, text)
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        await self.sim.telegram_call()
+        self.text = text
+        return self
+
+    async def reply_document(self, document, **kwargs) -> "FakeMessage":
+        await self.sim.telegram_call()
+        # Read it like an upload would, so export cost is included
+        if hasattr(document, "read"):
+            while document.read(1 << 16):
+                pass
+        return FakeMessage(self.sim, self.from_user)
+
+    async def delete(self):
+        await self.sim.telegram_call()
+
+
+class FakeCallbackQuery:
+    def __init__(self, sim: "Simulation", user, data: str):
+        self.from_user = user
+        self.data = data
+        self.message = FakeMessage(sim, user)
+        self.sim = sim
+
+    async def answer(self, *args, **kwargs):
+        await self.sim.telegram_call()
+
+
+class FakeInlineQuery:
+    def __init__(self, sim: "Simulation", user, query: str, offset: str = ""):
+        self.from_user = user
+        self.query = query
+        self.offset = offset
+        self.sim = sim
+
+    async def answer(self, results, *args, **kwargs):
+        await self.sim.telegram_call()
+
+
+class FakeCursor:
+    def __init__(self, collection: "FakeCollection", documents: List[Dict[str, Any]], projection):
+        self.collection = collection
+        self.documents = documents
+        self.projection = projection
+        self._limit = None
+
+    def sort(self, keys, direction=None):
+        if isinstance(keys, str):
+            keys = [(keys, direction)]
+        for key, order in reversed(keys):
+            self.documents.sort(key=lambda document: document[key], reverse=order == -1)
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _results(self):
+        documents = self.documents[: self._limit] if self._limit else self.documents
+        if self.projection:
+            fields = [field for field, wanted in self.projection.items() if wanted]
+            documents = [{field: document[field] for field in fields if field in document} for document in documents]
+        return documents
+
+    async def to_list(self, length: Optional[int] = None):
+        await self.collection.round_trip()
+        return self._results()[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self.collection.round_trip()
+        for document in self._results():
+            yield document
+
+
+def matches(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    operators = {
+        "$lt": lambda a, b: a < b,
+        "$lte": lambda a, b: a <= b,
+        "$gt": lambda a, b: a > b,
+        "$gte": lambda a, b: a >= b,
+        "$ne": lambda a, b: a != b,
+    }
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, option) for option in condition):
+                return False
+        elif isinstance(condition, dict):
+            if key not in document:
+                return False
+            if not all(operators[op](document[key], value) for op, value in condition.items()):
+                return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    # In-memory Mongo stand-in covering the calls the bot makes, with a
+    # fixed round-trip latency. Documents are bucketed by user_id so lookups
+    # behave like the indexed queries they replace.
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.by_user: Dict[Any, List[Dict[str, Any]]] = {}
+        self.round_trips = 0
+
+    async def round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _store(self, document: Dict[str, Any]):
+        document.setdefault("_id", ObjectId())
+        self.by_user.setdefault(document.get("user_id"), []).append(document)
+
+    async def insert_one(self, document):
+        await self.round_trip()
+        self._store(document)
+
+    async def insert_many(self, documents, ordered=True):
+        await self.round_trip()
+        for document in documents:
+            self._store(document)
+
+    def find(self, query, projection=None):
+        candidates = self.by_user.get(query["user_id"], []) if "user_id" in query else [
+            document for documents in self.by_user.values() for document in documents
+        ]
+        return FakeCursor(self, [document for document in candidates if matches(document, query)], projection)
+
+    async def find_one(self, query, projection=None):
+        results = await self.find(query).limit(1).to_list(1)
+        return results[0] if results else None
+
+    async def create_index(self, *args, **kwargs):
+        await self.round_trip()
+
+
+class FakeSessionBackend:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sessions: Dict[int, Dict[str, Any]] = {}
+
+    async def open(self):
+        pass
+
+    async def load(self, user_id: int):
+        await asyncio.sleep(self.latency)
+        return self.sessions.get(user_id)
+
+    async def save(self, user_id: int, fields: Dict[str, Any]):
+        await asyncio.sleep(self.latency)
+        self.sessions.setdefault(user_id, {}).update(fields)
+
+
+class Simulation:
+    def __init__(self, args):
+        self.args = args
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.error_types: Set[type] = set()
+        self.completed = 0
+        self.started = 0
+        self.telegram_calls = 0
+        self.loop_lag: List[float] = []
+        self.timeline: List[Dict[str, float]] = []
+        self.users = [
+            SimpleNamespace(id=100000 + i, username=f"user{i}", first_name=f"User{i}", last_name="")
+            for i in range(args.users)
+        ]
+
+    async def telegram_call(self):
+        self.telegram_calls += 1
+        if self.args.telegram_latency:
+            await asyncio.sleep(self.args.telegram_latency)
+
+    def arrivals(self):
+        # Yields the delay before each next update
+        args = self.args
+        elapsed = 0.0
+        while elapsed < args.duration:
+            if args.pattern == "burst":
+                for _ in range(args.burst_size):
+                    yield 0.0
+                elapsed += args.burst_every
+                yield args.burst_every
+                continue
+            rate = args.rate
+            if args.pattern == "ramp":
+                rate = args.rate + (args.peak_rate - args.rate) * min(1.0, elapsed / args.duration)
+            delay = random.expovariate(rate) if rate > 0 else args.duration
+            elapsed += delay
+            yield delay
+
+    async def update(self, commands, mix):
+        user = random.choice(self.users)
+        action = random.choices(list(mix), weights=list(mix.values()))[0]
+        locale = random.choice(list(commands.LOCALES.values()))
+        started = time.perf_counter()
+        try:
+            if action == "generate":
+                await commands.generate_callback(None, FakeCallbackQuery(self, user, f"generate_{locale.value}"))
+            elif action == "regenerate":
+                await commands.regenerate_command(None, FakeMessage(self, user, "/regenerate"))
+            elif action == "start":
+                await commands.start_command(None, FakeMessage(self, user, "/start"))
+            elif action == "menu":
+                await commands.generate_command(None, FakeMessage(self, user, "/generate"))
+            elif action == "inline":
+                query = f"{locale.value} {random.randint(1, 10)}"
+                await commands.inline_query_handler(None, FakeInlineQuery(self, user, query))
+            elif action == "history":
+                await commands.history_command(None, FakeMessage(self, user, "/history 5"))
+            elif action == "export":
+                await commands.export_command(None, FakeMessage(self, user, "/export csv"))
+            elif action == "log":
+                await commands.log_command(None, FakeMessage(self, user, "/log 20"))
+            self.latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            self.errors += 1
+            # Log each kind of failure once, with its traceback; repeats only count
+            if type(e) not in self.error_types:
+                self.error_types.add(type(e))
+                log.exception(f"{action} failed for user {user.id}: {e!r}")
+        finally:
+            self.completed += 1
+
+    async def monitor_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + 0.05
+            await asyncio.sleep(0.05)
+            self.loop_lag.append(max(0.0, loop.time() - expected))
+
+    async def report(self, began: float):
+        last_completed, last_latencies = 0, 0
+        baseline_rss, baseline_fds = rss_bytes(), open_fds()
+        while True:
+            await asyncio.sleep(self.args.report_every)
+            window = self.latencies[last_latencies:]
+            lag = self.loop_lag[-int(self.args.report_every / 0.05) :]
+            row = {
+                "t": round(time.perf_counter() - began, 1),
+                "in_flight": self.started - self.completed,
+                "throughput": (self.completed - last_completed) / self.args.report_every,
+                "p50_ms": percentile(window, 0.50) * 1e3,
+                "p99_ms": percentile(window, 0.99) * 1e3,
+                "loop_lag_max_ms": max(lag, default=0.0) * 1e3,
+                "rss_growth_mb": (rss_bytes() - baseline_rss) / 2**20,
+                "fd_growth": open_fds() - baseline_fds,
+                "errors": self.errors,
+            }
+            self.timeline.append(row)
+            last_completed, last_latencies = self.completed, len(self.latencies)
+            print(
+                f"t={row['t']:>6}s in-flight={row['in_flight']:>5} "
+                f"{row['throughput']:>7.1f}/s p50={row['p50_ms']:>7.1f}ms p99={row['p99_ms']:>8.1f}ms "
+                f"lag={row['loop_lag_max_ms']:>6.1f}ms rss+{row['rss_growth_mb']:>6.1f}MB "
+                f"fds+{row['fd_growth']} errors={row['errors']}"
+            )
+
+
+def install_stand_ins(args):
+    # Point history storage at one in-memory collection (or a throwaway
+    # SQLite file with --storage sqlite) and keep user logs out of the
+    # working tree.
+    from logs.log_store import log_store
+    from utils import database
+    from utils.session_store import session_store
+    from utils.storage import MongoStorage, SQLiteStorage
+
+    collection = FakeCollection(args.mongo_latency)
+    if args.storage == "sqlite":
+        storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(prefix="load_sim_history_"), "history.db"))
+    else:
+        storage = MongoStorage()
+        storage._collection = collection
+    database.storage = storage
+    database.write_buffer.storage = storage
+    session_store._backend = FakeSessionBackend(args.mongo_latency)
+    log_store.directory = tempfile.mkdtemp(prefix="load_sim_logs_")
+    return collection
+
+
+async def simulate(args):
+    collection = install_stand_ins(args)
+
+    import handlers.commands as commands
+    from utils.database import write_buffer
+    from utils.engine import generation_engine
+    from utils.inline_cache import inline_cache
+    from utils.prefetch import profile_pool
+    from utils.sender import TokenBucket, sender
+
+    mix = {}
+    for part in args.mix.split(","):
+        name, weight = part.split("=")
+        mix[name] = float(weight)
+
+    if not args.verbose:
+        logging.getLogger("FakeDetailsGenLogs").setLevel(logging.WARNING)
+    if args.send_rate is not None:
+        sender._global = TokenBucket(args.send_rate, args.send_rate)
+    if args.workers is not None:
+        generation_engine.workers = args.workers or os.cpu_count()
+        generation_engine.mode = args.executor
+        generation_engine.start()
+    write_buffer.start()
+    sender.start()
+    await profile_pool.start(commands.LOCALES.values())
+    inline_cache.start(commands.LOCALES)
+
+    sim = Simulation(args)
+    began = time.perf_counter()
+    background = [asyncio.create_task(sim.monitor_lag()), asyncio.create_task(sim.report(began))]
+    tasks = set()
+    for delay in sim.arrivals():
+        if delay:
+            await asyncio.sleep(delay)
+        sim.started += 1
+        task = asyncio.create_task(sim.update(commands, mix))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - began
+
+    for task in background:
+        task.cancel()
+    await inline_cache.stop()
+    await profile_pool.stop()
+    await sender.stop()
+    await write_buffer.stop()
+    generation_engine.shutdown()
+
+    summary = {
+        "updates": sim.completed,
+        "errors": sim.errors,
+        "seconds": elapsed,
+        "throughput": sim.completed / elapsed,
+        "p50_ms": percentile(sim.latencies, 0.50) * 1e3,
+        "p95_ms": percentile(sim.latencies, 0.95) * 1e3,
+        "p99_ms": percentile(sim.latencies, 0.99) * 1e3,
+        "max_ms": max(sim.latencies, default=0.0) * 1e3,
+        "loop_lag_p99_ms": percentile(sim.loop_lag, 0.99) * 1e3,
+        "telegram_calls": sim.telegram_calls,
+        "mongo_round_trips": collection.round_trips,
+        "timeline": sim.timeline,
+    }
+    print(
+        f"\n{summary['updates']} updates in {elapsed:.1f}s "
+        f"({summary['throughput']:.1f}/s), errors={summary['errors']}, "
+        f"p50={summary['p50_ms']:.1f}ms p95={summary['p95_ms']:.1f}ms "
+        f"p99={summary['p99_ms']:.1f}ms max={summary['max_ms']:.1f}ms, "
+        f"loop lag p99={summary['loop_lag_p99_ms']:.1f}ms, "
+        f"{summary['telegram_calls']} Telegram calls, {summary['mongo_round_trips']} Mongo round trips"
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the bot's handlers with synthetic load")
+    parser.add_argument("--users", type=int, default=2000, help="Virtual users")
+    parser.add_argument("--pattern", choices=("poisson", "burst", "ramp"), default="poisson")
+    parser.add_argument("--rate", type=float, default=100, help="Updates per second (ramp: start rate)")
+    parser.add_argument("--peak-rate", type=float, default=500, help="Ramp end rate")
+    parser.add_argument("--burst-size", type=int, default=200)
+    parser.add_argument("--burst-every", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals")
+    parser.add_argument(
+        "--mix",
+        default="generate=6,regenerate=3,menu=2,start=1,history=1,log=1",
+        help="Action weights: generate, regenerate, menu, start, inline, history, export, log",
+    )
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--mongo-latency", type=float, default=0.002)
+    parser.add_argument(
+        "--storage", choices=("mongo", "sqlite"), default="mongo",
+        help="History backend: the in-memory Mongo stand-in or a temporary SQLite file",
+    )
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Generation workers (0 = one per core); omit to generate on the event loop",
+    )
+    parser.add_argument(
+        "--send-rate", type=float, default=None,
+        help="Override the global send rate, e.g. to find the ceiling without Telegram's limit",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Keep the bot's INFO logging")
+    parser.add_argument("--report-every", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the summary and timeline as JSON")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    asyncio.run(simulate(args))
+
+
+if __name__ == "__main__":
+    main()
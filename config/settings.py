@@ -9,3 +9,132 @@ API_HASH = os.getenv("API_HASH")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = "fake_details_db"
+
+# Profile history lives in "mongo" or an embedded "sqlite" file
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", "data/history.db")
+# Mongo connection pool, timeouts and write concern ("1", "majority", ...)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "1")
+
+# Number of locales whose mimesis providers are kept loaded in memory
+PROVIDER_CACHE_SIZE = int(os.getenv("PROVIDER_CACHE_SIZE", "35"))
+# Locales loaded at startup so the first users don't pay for cold data
+WARM_LOCALES = [
+    locale.strip()
+    for locale in os.getenv("WARM_LOCALES", "en,ru,de,es,fr,en-gb").split(",")
+    if locale.strip()
+]
+
+# Ready-made profiles kept per locale, adapted to recent demand
+PREFETCH_MIN_SIZE = int(os.getenv("PREFETCH_MIN_SIZE", "2"))
+PREFETCH_MAX_SIZE = int(os.getenv("PREFETCH_MAX_SIZE", "50"))
+# Refill starts below LOW * size and stops at HIGH * size
+PREFETCH_LOW_WATERMARK = float(os.getenv("PREFETCH_LOW_WATERMARK", "0.5"))
+PREFETCH_HIGH_WATERMARK = float(os.getenv("PREFETCH_HIGH_WATERMARK", "1.0"))
+PREFETCH_DEMAND_WINDOW = float(os.getenv("PREFETCH_DEMAND_WINDOW", "60"))
+PREFETCH_ADAPT_INTERVAL = float(os.getenv("PREFETCH_ADAPT_INTERVAL", "10"))
+# Buffered profiles and buffer sizes are saved here on shutdown and served
+# first after a restart (empty disables); older snapshots are discarded
+PREFETCH_SNAPSHOT_PATH = os.getenv("PREFETCH_SNAPSHOT_PATH", "data/prefetch_snapshot.json")
+PREFETCH_SNAPSHOT_MAX_AGE = float(os.getenv("PREFETCH_SNAPSHOT_MAX_AGE", "86400"))
+
+# Profile generation runs in a "process" or "thread" pool; 0 workers = one per core
+GENERATION_EXECUTOR = os.getenv("GENERATION_EXECUTOR", "process")
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "0"))
+GENERATION_MAX_PENDING = int(os.getenv("GENERATION_MAX_PENDING", "256"))
+
+# /bulk limits: records per request, records per user per day, concurrent jobs
+BULK_MAX_COUNT = int(os.getenv("BULK_MAX_COUNT", "10000"))
+BULK_DAILY_QUOTA = int(os.getenv("BULK_DAILY_QUOTA", "50000"))
+BULK_MAX_CONCURRENT = int(os.getenv("BULK_MAX_CONCURRENT", "2"))
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "250"))
+# Seconds between progress edits, bytes kept in memory before spilling to disk
+BULK_PROGRESS_INTERVAL = float(os.getenv("BULK_PROGRESS_INTERVAL", "3"))
+BULK_SPOOL_SIZE = int(os.getenv("BULK_SPOOL_SIZE", str(1024 * 1024)))
+
+# Profiles are written to Mongo in batches by a background flusher
+WRITE_BUFFER_SIZE = int(os.getenv("WRITE_BUFFER_SIZE", "10000"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0"))
+# What to do when the buffer is full: drop_oldest, drop_newest or block
+WRITE_OVERFLOW_POLICY = os.getenv("WRITE_OVERFLOW_POLICY", "drop_oldest")
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", "5"))
+WRITE_RETRY_BACKOFF = float(os.getenv("WRITE_RETRY_BACKOFF", "0.5"))
+
+# /history entries per page by default and at most
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "5"))
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "20"))
+
+# History exports read this many entries per round trip and spill to disk past
+# EXPORT_SPOOL_SIZE bytes
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE", str(1024 * 1024)))
+
+# How often buffered logs hit disk
+LOG_FLUSH_RECORDS = int(os.getenv("LOG_FLUSH_RECORDS", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+# Write structured JSON log lines instead of plain text
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() in ("1", "true", "yes")
+
+# User logs are appended to segment files that roll over at LOG_SEGMENT_SIZE
+# bytes; the oldest segments are deleted past LOG_RETENTION_SIZE bytes
+LOG_SEGMENT_SIZE = int(os.getenv("LOG_SEGMENT_SIZE", str(64 * 1024 * 1024)))
+LOG_RETENTION_SIZE = int(os.getenv("LOG_RETENTION_SIZE", str(1024 * 1024 * 1024)))
+# /log lines sent by default and at most
+LOG_TAIL_DEFAULT = int(os.getenv("LOG_TAIL_DEFAULT", "100"))
+LOG_TAIL_MAX = int(os.getenv("LOG_TAIL_MAX", "5000"))
+
+# Last selected country per user: "mongo" or a local "sqlite" file, with an
+# in-process LRU of SESSION_CACHE_SIZE users in front
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "mongo")
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "data/sessions.db")
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+# Sessions unused for this many seconds are deleted
+SESSION_RETENTION = int(os.getenv("SESSION_RETENTION", str(90 * 86400)))
+
+# Outgoing messages per second overall and per chat (with a short burst)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "16"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+
+# Prometheus metrics and profiling endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9696"))
+# Who may call /debug/profile: "off", "local" (loopback clients) or "any"
+METRICS_PROFILE_ACCESS = os.getenv("METRICS_PROFILE_ACCESS", "local")
+
+# Inline mode: pre-rendered results kept per locale, results per page by
+# default, seconds Telegram may cache an answer, seconds before a rebuild
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "50"))
+INLINE_PAGE_SIZE = int(os.getenv("INLINE_PAGE_SIZE", "5"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "10"))
+INLINE_REFRESH_INTERVAL = float(os.getenv("INLINE_REFRESH_INTERVAL", "30"))
+
+# Streaming profile API (GET /profiles) served next to the bot
+PROFILE_API_ENABLED = os.getenv("PROFILE_API_ENABLED", "true").lower() in ("1", "true", "yes")
+PROFILE_API_HOST = os.getenv("PROFILE_API_HOST", "127.0.0.1")
+PROFILE_API_PORT = int(os.getenv("PROFILE_API_PORT", "8700"))
+PROFILE_API_MAX_COUNT = int(os.getenv("PROFILE_API_MAX_COUNT", "1000000"))
+# Concurrent streams per client address, profiles per generated chunk and
+# chunks generated ahead of the client; 0 = one per generation worker
+PROFILE_API_CLIENT_CONCURRENCY = int(os.getenv("PROFILE_API_CLIENT_CONCURRENCY", "2"))
+PROFILE_API_BATCH_SIZE = int(os.getenv("PROFILE_API_BATCH_SIZE", "500"))
+PROFILE_API_PIPELINE = int(os.getenv("PROFILE_API_PIPELINE", "0"))
+
+# Uniqueness mode: Bloom filters sized for this many values per user and
+# overall, at this false-positive rate, kept in UNIQUE_DIR between restarts
+UNIQUE_DIR = os.getenv("UNIQUE_DIR", "data/unique")
+UNIQUE_ERROR_RATE = float(os.getenv("UNIQUE_ERROR_RATE", "0.001"))
+UNIQUE_USER_CAPACITY = int(os.getenv("UNIQUE_USER_CAPACITY", "1000000"))
+UNIQUE_GLOBAL_CAPACITY = int(os.getenv("UNIQUE_GLOBAL_CAPACITY", "10000000"))
+# Filters held in memory at once, redraws of one field before giving up
+UNIQUE_CACHE_SIZE = int(os.getenv("UNIQUE_CACHE_SIZE", "16"))
+UNIQUE_MAX_ATTEMPTS = int(os.getenv("UNIQUE_MAX_ATTEMPTS", "10"))
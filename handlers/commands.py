@@ -1,24 +1,69 @@
 from mimesis.enums import Locale
 from pyrogram import Client, filters
+from pyrogram.enums import ParseMode
 from pyrogram.types import (
     CallbackQuery,
+    ChosenInlineResult,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InlineQuery,
     Message,
 )
-from config.settings import API_HASH, API_ID, BOT_TOKEN
-from logs.logger import get_user_logger, setup_logger, logger
-from utils.database import save_details_to_db, users_collection
-from utils.details_generator import generate_details
+from config.settings import (
+    API_HASH,
+    API_ID,
+    BOT_TOKEN,
+    BULK_MAX_COUNT,
+    HISTORY_PAGE_MAX,
+    INLINE_CACHE_SIZE,
+    INLINE_CACHE_TIME,
+    INLINE_PAGE_SIZE,
+    LOG_TAIL_DEFAULT,
+    LOG_TAIL_MAX,
+)
+from logs.log_store import log_store
+from logs.logger import flush_logs, get_user_logger, logger
+from utils.bulk_export import BULK_FORMATS, BulkExport, bulk_quota, generate_bulk
+from utils.database import (
+    decode_history_key,
+    encode_history_key,
+    fetch_history_page,
+    save_profile_to_db,
+)
+from utils.details_generator import (
+    TEMPLATE_ALIASES,
+    compile_template,
+    generate_profile,
+    materialise,
+    template_fields,
+)
+from utils.history_export import EXPORT_FORMATS, export_history
+from utils.inline_cache import build_locale_index, decode_result_id, inline_cache
+from utils.metrics import instrument
+from utils.prefetch import profile_pool
+from utils.renderer import MESSAGE_LIMIT, message_length, render_profile, split_message
+from utils.sender import BULK, edit_text, reply_document, reply_text
+from utils.session_store import session_store
+from utils.uniqueness import UNIQUE_SCOPES, unique_filters
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+import asyncio
+import html
+import io
 import os
-
-app = Client("fake_details_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+import time
+
+app = Client(
+    "fake_details_bot",
+    api_id=API_ID,
+    api_hash=API_HASH,
+    bot_token=BOT_TOKEN,
+    parse_mode=ParseMode.HTML,
+)
 
 # Ensure the logs directory exists
 os.makedirs("logs", exist_ok=True)
 
-user_states = {}
-
 LOCALES = {
     "🇨🇿 Czech": Locale.CS,
     "🇩🇰 Danish": Locale.DA,
@@ -57,10 +102,30 @@ LOCALES = {
     "🇨🇳 Chinese": Locale.ZH,
 }
 
+LOCALE_CODES = {locale.value: locale for locale in LOCALES.values()}
+LOCALE_INDEX = build_locale_index(LOCALES)
+
+def build_generate_keyboard() -> InlineKeyboardMarkup:
+    keyboard = []
+    row = []
+    for i, (country, locale) in enumerate(LOCALES.items()):
+        row.append(
+            InlineKeyboardButton(country, callback_data=f"generate_{locale.value}")
+        )
+        if (i + 1) % 2 == 0:
+            keyboard.append(row)
+            row = []
+    if row:
+        keyboard.append(row)
+    return InlineKeyboardMarkup(keyboard)
+
+# The country picker never changes, so /generate sends the same markup
+GENERATE_KEYBOARD = build_generate_keyboard()
+
 @app.on_message(filters.command("start"))
+@instrument("start")
 async def start_command(client: Client, message: Message):
     user_id = message.from_user.id
-    setup_logger(user_id)
     user_logger = get_user_logger(user_id)
 
     username = message.from_user.username
@@ -76,36 +141,27 @@ async def start_command(client: Client, message: Message):
         "<b>Commands:</b>\n"
         "♦️ /generate – Generate fake details\n"
         "♦️ /regenerate – Regenerate details for the last selected country\n"
+        "♦️ /template – Choose which fields profiles include\n"
+        "♦️ /bulk – Export many profiles as a CSV/JSONL file\n"
         "♦️ /history – Show command history\n"
+        "♦️ /export – Export your history as HTML/CSV/JSONL\n"
         "♦️ /log – Show bot log\n"
         "Type /generate to start generating fake details."
     )
 
-    await message.reply_text(welcome_message)
+    await reply_text(message, welcome_message)
     logger.info(f"Displayed start message for {username} (ID: {user_id})")
     user_logger.info(f"Displayed start message for {username} (ID: {user_id})")
 
 @app.on_message(filters.command("generate"))
+@instrument("generate")
 async def generate_command(client: Client, message: Message):
     user_id = message.from_user.id
-    setup_logger(user_id)
     user_logger = get_user_logger(user_id)
 
-    keyboard = []
-    row = []
-    for i, (country, locale) in enumerate(LOCALES.items()):
-        row.append(
-            InlineKeyboardButton(country, callback_data=f"generate_{locale.value}")
-        )
-        if (i + 1) % 2 == 0:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await message.reply_text(
-        "Select a country to generate fake details:", reply_markup=reply_markup
+    await reply_text(
+        message,
+        "Select a country to generate fake details:", reply_markup=GENERATE_KEYBOARD
     )
     logger.info(
         f"Displayed country selection for {message.from_user.username} (ID: {message.from_user.id})"
@@ -114,67 +170,33 @@ async def generate_command(client: Client, message: Message):
         f"Displayed country selection for {message.from_user.username} (ID: {message.from_user.id})"
     )
 
+async def next_profile(user_id: int, locale: Locale):
+    # Full profiles come from the prefetch pool; a /template selection is
+    # generated on demand with only its fields
+    template = await session_store.get_template(user_id)
+    if template:
+        return await generate_profile(locale, template)
+    return await profile_pool.get(locale)
+
 @app.on_callback_query(filters.regex(r"^generate_"))
+@instrument("generate_callback")
 async def generate_callback(client: Client, callback_query: CallbackQuery):
+    user_logger = get_user_logger(callback_query.from_user.id)
     try:
         locale_value = callback_query.data.split("_")[1]
-        locale = Locale(locale_value)
-        user_states[callback_query.from_user.id] = locale_value
+        locale = LOCALE_CODES[locale_value]
+        await session_store.set_locale(callback_query.from_user.id, locale_value)
 
         # Logging for debugging
         logger.info(f"Generating details for locale: {locale_value}")
-        user_logger = get_user_logger(callback_query.from_user.id)
         user_logger.info(f"Generating details for locale: {locale_value}")
 
-        details = await generate_details(locale)
-
-        response = f"<b>Personal Profile: {details['Full Name']}</b>\n\n"
-        for key, value in details.items():
-            icon = (
-                "👤"
-                if key == "Full Name"
-                else "🎂"
-                if key == "Age"
-                else "📅"
-                if key == "Birth Date"
-                else "⚧️"
-                if key == "Sex"
-                else "🏛️"
-                if key == "University"
-                else "🏠"
-                if key == "Street Name"
-                else "🏙️"
-                if key == "City"
-                else "🇺🇸"
-                if key == "State"
-                else "🌎"
-                if key == "Country"
-                else "📮"
-                if key == "Postal Code"
-                else "🏢"
-                if key == "Company"
-                else "📞"
-                if key == "Phone Number"
-                else "💼"
-                if key == "Occupation"
-                else "🌍"
-                if key == "Nationality"
-                else "🗣️"
-                if key == "Language"
-                else "🖥️"
-                if key == "Username"
-                else "🔐"
-                if key == "Password"
-                else "⚖️"
-                if key == "Weight"
-                else "📏"
-                if key == "Height"
-                else ""
-            )
-            response += f"{icon} <b>{key}:</b> `{value}`\n"
+        profile, details = await next_profile(callback_query.from_user.id, locale)
 
-        await save_details_to_db(
-            callback_query.from_user.id, callback_query.from_user.username, details
+        response = render_profile(details)
+
+        await save_profile_to_db(
+            callback_query.from_user.id, callback_query.from_user.username, profile
         )
 
         user_logger.info(
@@ -183,7 +205,10 @@ async def generate_callback(client: Client, callback_query: CallbackQuery):
 
         # Answer the callback query
         await callback_query.answer()
-        await callback_query.message.edit_text(response)
+        first, *rest = split_message(response)
+        await edit_text(callback_query.message, first)
+        for chunk in rest:
+            await reply_text(callback_query.message, chunk)
         logger.info(
             f"Displayed generated details for {callback_query.from_user.username} (ID: {callback_query.from_user.id})"
         )
@@ -195,64 +220,22 @@ async def generate_callback(client: Client, callback_query: CallbackQuery):
         )
 
 @app.on_message(filters.command("regenerate"))
+@instrument("regenerate")
 async def regenerate_command(client: Client, message: Message):
     user_id = message.from_user.id
-    setup_logger(user_id)
     user_logger = get_user_logger(user_id)
 
-    if user_id not in user_states:
-        await message.reply_text("Please use /generate first to select a country.")
+    locale_value = await session_store.get_locale(user_id)
+    if locale_value is None:
+        await reply_text(message, "Please use /generate first to select a country.")
         return
 
-    locale = Locale(user_states[user_id])
-    details = await generate_details(locale)
-
-    response = f"<b>Personal Profile: {details['Full Name']}</b>\n\n"
-    for key, value in details.items():
-        icon = (
-            "👤"
-            if key == "Full Name"
-            else "🎂"
-            if key == "Age"
-            else "📅"
-            if key == "Birth Date"
-            else "⚧️"
-            if key == "Sex"
-            else "🏛️"
-            if key == "University"
-            else "🏠"
-            if key == "Street Name"
-            else "🏙️"
-            if key == "City"
-            else "🇺🇸"
-            if key == "State"
-            else "🌎"
-            if key == "Country"
-            else "📮"
-            if key == "Postal Code"
-            else "🏢"
-            if key == "Company"
-            else "📞"
-            if key == "Phone Number"
-            else "💼"
-            if key == "Occupation"
-            else "🌍"
-            if key == "Nationality"
-            else "🗣️"
-            if key == "Language"
-            else "🖥️"
-            if key == "Username"
-            else "🔐"
-            if key == "Password"
-            else "⚖️"
-            if key == "Weight"
-            else "📏"
-            if key == "Height"
-            else ""
-        )
-        response += f"{icon} <b>{key}:</b> `{value}`\n"
+    locale = Locale(locale_value)
+    profile, details = await next_profile(user_id, locale)
+
+    response = render_profile(details)
 
-    await save_details_to_db(user_id, message.from_user.username, details)
+    await save_profile_to_db(user_id, message.from_user.username, profile)
 
     user_logger.info(
         f"Displayed regenerated details for {message.from_user.username} ({message.from_user.id})"
@@ -261,182 +244,412 @@ async def regenerate_command(client: Client, message: Message):
         f"Regenerated additional log details for {message.from_user.username} ({message.from_user.id})"
     )
 
-    await message.reply_text(response)
+    for chunk in split_message(response):
+        await reply_text(message, chunk)
     logger.info(
         f"Displayed regenerated details for {message.from_user.username} (ID: {message.from_user.id})"
     )
 
+@app.on_message(filters.command("template"))
+@instrument("template")
+async def template_command(client: Client, message: Message):
+    user_id = message.from_user.id
+    user_logger = get_user_logger(user_id)
+
+    spec = " ".join(message.command[1:]).strip().lower()
+    if not spec:
+        template = await session_store.get_template(user_id)
+        current = ", ".join(template_fields(template)) if template else "all fields"
+        await reply_text(
+            message,
+            f"<b>Current template:</b> {html.escape(current)}\n\n"
+            "Usage: /template name,phone,address or /template all\n"
+            f"Fields: {', '.join(TEMPLATE_ALIASES)}"
+        )
+        return
+
+    try:
+        template = "" if spec in ("all", "reset") else compile_template(spec)
+    except ValueError as e:
+        await reply_text(message, f"{html.escape(str(e))}. Send /template to see the fields.")
+        return
+
+    await session_store.set_template(user_id, template)
+    current = ", ".join(template_fields(template)) if template else "all fields"
+    await reply_text(message, f"Profiles will now include: {html.escape(current)}")
+    user_logger.info(f"Set profile template to {current}")
+
+def parse_inline_query(query: str) -> Tuple[Optional[str], Optional[int]]:
+    # "@bot de", "@bot ja 5", "@bot 3" -> (locale prefix, results per page)
+    prefix, count = None, None
+    for token in query.lower().split()[:2]:
+        if token.isdigit():
+            count = int(token)
+        elif prefix is None:
+            prefix = token
+    return prefix, count
+
+@app.on_inline_query()
+@instrument("inline")
+async def inline_query_handler(client: Client, inline_query: InlineQuery):
+    prefix, count = parse_inline_query(inline_query.query)
+    is_personal = False
+    if prefix is None:
+        # An empty query offers the country this user picked last
+        locale_value = await session_store.get_locale(inline_query.from_user.id)
+        locale = Locale(locale_value) if locale_value else Locale.EN
+        is_personal = locale_value is not None
+    else:
+        matches = LOCALE_INDEX.get(prefix)
+        if not matches:
+            await inline_query.answer(
+                [],
+                cache_time=INLINE_CACHE_TIME,
+                switch_pm_text="Unknown country, open the bot",
+                switch_pm_parameter="inline",
+            )
+            return
+        locale = matches[0]
+
+    page_size = min(max(count or INLINE_PAGE_SIZE, 1), INLINE_CACHE_SIZE)
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    results, next_offset = inline_cache.page(locale, offset, page_size)
+    # A short page means the locale is still warming; don't let Telegram cache it
+    complete = len(results) >= min(page_size, INLINE_CACHE_SIZE - offset)
+    await inline_query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME if complete else 0,
+        is_personal=is_personal,
+        next_offset=next_offset,
+    )
+
+@app.on_chosen_inline_result()
+@instrument("inline_chosen")
+async def chosen_inline_result_handler(client: Client, chosen: ChosenInlineResult):
+    # Only delivered when inline feedback is enabled for the bot in @BotFather
+    profile = decode_result_id(chosen.result_id)
+    if profile is None:
+        return
+    await save_profile_to_db(chosen.from_user.id, chosen.from_user.username, profile)
+    get_user_logger(chosen.from_user.id).info(
+        f"Sent inline details for locale {profile.locale}"
+    )
+
+@app.on_message(filters.command("bulk"))
+@instrument("bulk")
+async def bulk_command(client: Client, message: Message):
+    user_id = message.from_user.id
+    user_logger = get_user_logger(user_id)
+
+    args = [arg.lower() for arg in message.command[1:]]
+    file_format, unique_scope = "csv", None
+    valid = len(args) >= 2 and args[0] in LOCALE_CODES
+    for arg in args[2:]:
+        if arg in BULK_FORMATS:
+            file_format = arg
+        elif arg.partition("=")[0] == "unique":
+            unique_scope = arg.partition("=")[2] or "export"
+            valid = valid and unique_scope in UNIQUE_SCOPES
+        else:
+            valid = False
+    if not valid:
+        await reply_text(
+            message,
+            "Usage: /bulk &lt;locale&gt; &lt;count&gt; [csv|jsonl] [unique[=export|user|global]]\n"
+            f"Locales: {', '.join(LOCALE_CODES)}"
+        )
+        return
+
+    try:
+        count = int(args[1])
+    except ValueError:
+        await reply_text(message, "Invalid count. Please enter a valid integer.")
+        return
+    if not 0 < count <= BULK_MAX_COUNT:
+        await reply_text(message, f"Count must be between 1 and {BULK_MAX_COUNT}.")
+        return
+    if not bulk_quota.reserve(user_id, count):
+        await reply_text(
+            message,
+            "You already have an export running or have reached today's quota "
+            f"({bulk_quota.remaining(user_id)} records left)."
+        )
+        return
+
+    locale = LOCALE_CODES[args[0]]
+    export = status = bloom = None
+    delivered = False
+    try:
+        # Everything after the reservation sits inside the try, so a failed
+        # status message still releases the quota and the spooled file
+        export = BulkExport(file_format)
+        status = await reply_text(message, f"Generating 0/{count} profiles...")
+        if unique_scope:
+            bloom = await unique_filters.get(unique_scope, count, user_id)
+        await generate_bulk(
+            locale,
+            count,
+            export,
+            lambda done: edit_text(status, f"Generating {done}/{count} profiles...", BULK),
+            await session_store.get_template(user_id),
+            bloom,
+        )
+        if unique_scope:
+            await unique_filters.flush()
+        await edit_text(status, f"Uploading {count} profiles...", BULK)
+        await reply_document(
+            message,
+            export.finish(),
+            file_name=f"profiles_{locale.value}_{count}.{file_format}.gz",
+            caption=f"{count} {locale.value} profiles",
+        )
+        delivered = True
+        try:
+            await status.delete()
+        except Exception as e:
+            # The file is already delivered; a leftover status line is harmless
+            logger.warning(f"Could not delete bulk status message: {e}")
+        logger.info(
+            f"Sent {count} {locale.value} profiles to {message.from_user.username} (ID: {user_id})"
+        )
+        user_logger.info(
+            f"Sent {count} {locale.value} profiles to {message.from_user.username} (ID: {user_id})"
+        )
+    except Exception as e:
+        logger.error(f"Error in bulk_command: {e}")
+        user_logger.error(f"Error in bulk_command: {e}")
+        if status is not None:
+            await edit_text(status, "An error occurred. Please try again.")
+    finally:
+        bulk_quota.release(user_id, 0 if delivered else count)
+        if export is not None:
+            export.close()
+        if bloom is not None:
+            unique_filters.release(bloom)
+
+def format_history_entry(entry) -> str:
+    return render_profile(entry["details"], title=f"Generated on: {entry['timestamp']}") + "\n"
+
+async def render_history_page(user_id: int, page_size: int, before=None, after=None):
+    page_size = min(page_size, HISTORY_PAGE_MAX)
+    entries, has_more = await fetch_history_page(user_id, page_size, before, after)
+    if not entries:
+        return None, None
+    await materialise(entries)
+
+    # Entries arrive closest to the page boundary first; keep as many as fit
+    # in one message and leave the rest for the next page.
+    header = "<b>Generated details history:</b>\n\n"
+    length = message_length(header)
+    page = []
+    for entry in entries:
+        block = format_history_entry(entry)
+        if page and length + message_length(block) > MESSAGE_LIMIT:
+            has_more = True
+            break
+        page.append((entry, block))
+        length += message_length(block)
+    if after is not None:
+        page.reverse()
+
+    has_newer = has_more if after is not None else before is not None
+    has_older = has_more if after is None else True
+    buttons = []
+    if has_newer:
+        key = encode_history_key(page[0][0])
+        buttons.append(
+            InlineKeyboardButton("⬅️ Newer", callback_data=f"history_n_{page_size}_{key}")
+        )
+    if has_older:
+        key = encode_history_key(page[-1][0])
+        buttons.append(
+            InlineKeyboardButton("Older ➡️", callback_data=f"history_o_{page_size}_{key}")
+        )
+
+    response = header + "".join(block for _, block in page)
+    return response, InlineKeyboardMarkup([buttons]) if buttons else None
+
 @app.on_message(filters.command("history"))
+@instrument("history")
 async def history_command(client: Client, message: Message):
     user_id = message.from_user.id
-    setup_logger(user_id)
     user_logger = get_user_logger(user_id)
 
     if len(message.command) > 1:
         try:
-            limit = int(message.command[1])
-            cursor = (
-                users_collection.find({"user_id": user_id}).sort("timestamp", -1).limit(limit)
-            )
-            history = await cursor.to_list(length=limit)
-
-            if not history:
-                await message.reply_text("No history found.")
-                return
-
-            response = f"<b>Last {limit} generated details:</b>\n\n"
-            for entry in history:
-                response += f"<b>Generated on:</b> {entry['timestamp']}\n"
-                for key, value in entry["details"].items():
-                    icon = (
-                        "👤"
-                        if key == "Full Name"
-                        else "🎂"
-                        if key == "Age"
-                        else "📅"
-                        if key == "Birth Date"
-                        else "⚧️"
-                        if key == "Sex"
-                        else "🏛️"
-                        if key == "University"
-                        else "🏠"
-                        if key == "Street Name"
-                        else "🏙️"
-                        if key == "City"
-                        else "🇺🇸"
-                        if key == "State"
-                        else "🌎"
-                        if key == "Country"
-                        else "📮"
-                        if key == "Postal Code"
-                        else "🏢"
-                        if key == "Company"
-                        else "📞"
-                        if key == "Phone Number"
-                        else "💼"
-                        if key == "Occupation"
-                        else "🌍"
-                        if key == "Nationality"
-                        else "🗣️"
-                        if key == "Language"
-                        else "🖥️"
-                        if key == "Username"
-                        else "🔐"
-                        if key == "Password"
-                        else "⚖️"
-                        if key == "Weight"
-                        else "📏"
-                        if key == "Height"
-                        else ""
-                    )
-                    response += f"{icon} <b>{key}:</b> `{value}`\n"
-                response += "\n"
-
-            await message.reply_text(response)
-            logger.info(
-                f"Displayed history for {message.from_user.username} (ID: {message.from_user.id})"
-            )
-            user_logger.info(
-                f"Displayed history for {message.from_user.username} (ID: {message.from_user.id})"
-            )
+            page_size = int(message.command[1])
         except ValueError:
-            await message.reply_text("Invalid limit. Please enter a valid integer.")
-    else:
-        cursor = (
-            users_collection.find({"user_id": user_id}).sort("timestamp", -1)
-        )
-        history = await cursor.to_list(length=1000)  # Arbitrary large number to fetch all records
+            await reply_text(message, "Invalid limit. Please enter a valid integer.")
+            return
+        if page_size < 1:
+            await reply_text(message, "Invalid limit. Please enter a positive integer.")
+            return
 
-        if not history:
-            await message.reply_text("No history found.")
+        response, reply_markup = await render_history_page(user_id, page_size)
+        if response is None:
+            await reply_text(message, "No history found.")
             return
 
-        html_content = "<html><body><h2>Generated Details History</h2>"
-        for entry in history:
-            html_content += f"<h3>Generated on: {entry['timestamp']}</h3>"
-            for key, value in entry["details"].items():
-                icon = (
-                    "👤"
-                    if key == "Full Name"
-                    else "🎂"
-                    if key == "Age"
-                    else "📅"
-                    if key == "Birth Date"
-                    else "⚧️"
-                    if key == "Sex"
-                    else "🏛️"
-                    if key == "University"
-                    else "🏠"
-                    if key == "Street Name"
-                    else "🏙️"
-                    if key == "City"
-                    else "🇺🇸"
-                    if key == "State"
-                    else "🌎"
-                    if key == "Country"
-                    else "📮"
-                    if key == "Postal Code"
-                    else "🏢"
-                    if key == "Company"
-                    else "📞"
-                    if key == "Phone Number"
-                    else "💼"
-                    if key == "Occupation"
-                    else "🌍"
-                    if key == "Nationality"
-                    else "🗣️"
-                    if key == "Language"
-                    else "🖥️"
-                    if key == "Username"
-                    else "🔐"
-                    if key == "Password"
-                    else "⚖️"
-                    if key == "Weight"
-                    else "📏"
-                    if key == "Height"
-                    else ""
-                )
-                html_content += f"<p>{icon} <b>{key}:</b> {value}</p>"
-            html_content += "<hr>"
-        html_content += "</body></html>"
-
-        file_path = f"logs/user_{user_id}_history.html"
-        with open(file_path, "w", encoding="utf-8") as file:
-            file.write(html_content)
-
-        await message.reply_document(file_path, caption="Your history file")
-        os.remove(file_path)
+        await reply_text(message, response, reply_markup=reply_markup)
         logger.info(
-            f"Displayed history HTML for {message.from_user.username} (ID: {message.from_user.id})"
+            f"Displayed history for {message.from_user.username} (ID: {message.from_user.id})"
         )
         user_logger.info(
-            f"Displayed history HTML for {message.from_user.username} (ID: {message.from_user.id})"
+            f"Displayed history for {message.from_user.username} (ID: {message.from_user.id})"
         )
+    else:
+        await send_history_export(message, user_logger, "html")
+
+async def send_history_export(
+    message: Message, user_logger, file_format: str, since=None, until=None, compress=False
+):
+    user_id = message.from_user.id
+    document, count = await export_history(user_id, file_format, since, until, compress)
+    try:
+        if not count:
+            await reply_text(message, "No history found.")
+            return
+
+        file_name = f"user_{user_id}_history.{file_format}" + (".gz" if compress else "")
+        await reply_document(
+            message,
+            document, file_name=file_name, caption="Your history file"
+        )
+    finally:
+        document.close()
+    logger.info(
+        f"Displayed history {file_format.upper()} for {message.from_user.username} (ID: {message.from_user.id})"
+    )
+    user_logger.info(
+        f"Displayed history {file_format.upper()} for {message.from_user.username} (ID: {message.from_user.id})"
+    )
+
+@app.on_message(filters.command("export"))
+@instrument("export")
+async def export_command(client: Client, message: Message):
+    user_id = message.from_user.id
+    user_logger = get_user_logger(user_id)
+
+    file_format = "html"
+    compress = False
+    dates = []
+    try:
+        for arg in message.command[1:]:
+            arg = arg.lower()
+            if arg in EXPORT_FORMATS:
+                file_format = arg
+            elif arg == "gz":
+                compress = True
+            else:
+                dates.append(datetime.strptime(arg, "%Y-%m-%d"))
+        if len(dates) > 2:
+            raise ValueError("too many dates")
+    except ValueError:
+        await reply_text(
+            message,
+            "Usage: /export [html|csv|jsonl] [from YYYY-MM-DD] [to YYYY-MM-DD] [gz]"
+        )
+        return
+
+    since = dates[0] if dates else None
+    until = dates[1] + timedelta(days=1) if len(dates) == 2 else None
+    try:
+        await send_history_export(message, user_logger, file_format, since, until, compress)
+    except Exception as e:
+        logger.error(f"Error in export_command: {e}")
+        user_logger.error(f"Error in export_command: {e}")
+        await reply_text(message, "An error occurred. Please try again.")
+
+@app.on_callback_query(filters.regex(r"^history_[on]_"))
+@instrument("history_callback")
+async def history_callback(client: Client, callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    user_logger = get_user_logger(user_id)
+
+    try:
+        _, direction, page_size, key = callback_query.data.split("_", 3)
+        position = decode_history_key(key)
+        if direction == "o":
+            response, reply_markup = await render_history_page(
+                user_id, int(page_size), before=position
+            )
+        else:
+            response, reply_markup = await render_history_page(
+                user_id, int(page_size), after=position
+            )
+
+        if response is None:
+            await callback_query.answer("No more history.")
+            return
+
+        await callback_query.answer()
+        await edit_text(callback_query.message, response, reply_markup=reply_markup)
+        user_logger.info(
+            f"Displayed history page for {callback_query.from_user.username} ({user_id})"
+        )
+    except Exception as e:
+        logger.error(f"Error in history_callback: {e}")
+        user_logger.error(f"Error in history_callback: {e}")
+        await callback_query.answer(
+            "An error occurred. Please try again.", show_alert=True
+        )
+
+SINCE_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+def parse_since(value: str) -> float:
+    # "30m", "2h", "7d" or a YYYY-MM-DD date, as a unix timestamp
+    if value[-1:].lower() in SINCE_UNITS:
+        return time.time() - float(value[:-1]) * SINCE_UNITS[value[-1].lower()]
+    return datetime.strptime(value, "%Y-%m-%d").timestamp()
 
 @app.on_message(filters.command("log"))
+@instrument("log")
 async def log_command(client: Client, message: Message):
     user_id = message.from_user.id
-    setup_logger(user_id)
     user_logger = get_user_logger(user_id)
 
+    args = message.command[1:]
+    lines = LOG_TAIL_DEFAULT
+    since = None
     try:
-        log_file_path = os.path.abspath(f"logs/user_{user_id}.log")
-        user_logger.info(f"Attempting to send log file from path: {log_file_path}")
-        logger.info(f"Checking existence of log file at path: {log_file_path}")
-        
-        if os.path.exists(log_file_path):
-            logger.info(f"Log file exists at path: {log_file_path}")
-            with open(log_file_path, "rb") as f:
-                await message.reply_document(f, caption="Your log file")
-            user_logger.info(f"Log file sent for user {user_id}.")
+        if len(args) == 2 and args[0].lower() == "since":
+            since = parse_since(args[1])
+            lines = LOG_TAIL_MAX
+        elif len(args) == 1:
+            lines = int(args[0])
+        elif args:
+            raise ValueError(args)
+    except ValueError:
+        await reply_text(
+            message,
+            "Usage: /log [lines] or /log since &lt;30m|2h|1d|YYYY-MM-DD&gt;"
+        )
+        return
+    lines = max(1, min(lines, LOG_TAIL_MAX))
+
+    try:
+        user_logger.info(f"Sending log for user {user_id}")
+        await asyncio.to_thread(flush_logs)
+        entries = await asyncio.to_thread(log_store.read, user_id, lines, since)
+
+        if not entries:
+            await reply_text(message, "No log entries found.")
+            return
+
+        text = html.escape("\n".join(entries))
+        if message_length(text) + len("<pre></pre>") <= MESSAGE_LIMIT:
+            await reply_text(message, f"<pre>{text}</pre>")
         else:
-            logger.error(f"Log file not found at path: {log_file_path}")
-            user_logger.error(f"Log file not found for user {user_id}.")
-            await message.reply_text("Log file not found.")
+            document = io.BytesIO("\n".join(entries).encode("utf-8"))
+            await reply_document(
+                message,
+                document, file_name=f"user_{user_id}.log", caption="Your log file"
+            )
+        logger.info(f"Sent {len(entries)} log lines for user {user_id}")
     except Exception as e:
         logger.error(f"Error sending log file: {e}")
         user_logger.error(f"Error sending log file: {e}")
-        await message.reply_text("Error sending log file. Please check the server logs.")
+        await reply_text(message, "Error sending log file. Please check the server logs.")
 
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,371 @@
+import json
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import LOG_RETENTION_SIZE, LOG_SEGMENT_SIZE
+
+# One sidecar index record per log line: user id, unix time, offset, length
+INDEX_RECORD = struct.Struct("<qdQI")
+# Sealed segments also get their records sorted by user, after a header with
+# the segment's newest timestamp and its record count
+SORTED_HEADER = struct.Struct("<dQ")
+
+Lines = Tuple[array, array, array]
+
+
+class SegmentIndex:
+    # Per-user positions of lines inside one segment, in append order
+    def __init__(self):
+        self.users: Dict[int, Lines] = {}
+        self.last_timestamp = 0.0
+
+    def add(self, user_id: int, timestamp: float, offset: int, length: int):
+        self.last_timestamp = max(self.last_timestamp, timestamp)
+        entry = self.users.get(user_id)
+        if entry is None:
+            entry = self.users[user_id] = (array("d"), array("Q"), array("I"))
+        entry[0].append(timestamp)
+        entry[1].append(offset)
+        entry[2].append(length)
+
+    def save_sorted(self, path: str):
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            count = sum(len(offsets) for _, offsets, _ in self.users.values())
+            file.write(SORTED_HEADER.pack(self.last_timestamp, count))
+            for user_id in sorted(self.users):
+                timestamps, offsets, lengths = self.users[user_id]
+                file.write(
+                    b"".join(
+                        INDEX_RECORD.pack(user_id, *record)
+                        for record in zip(timestamps, offsets, lengths)
+                    )
+                )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, index_path: str, log_size: int) -> "SegmentIndex":
+        index = cls()
+        with open(index_path, "rb") as file:
+            while True:
+                chunk = file.read(INDEX_RECORD.size * 4096)
+                if not chunk:
+                    break
+                usable = len(chunk) - len(chunk) % INDEX_RECORD.size
+                for user_id, timestamp, offset, length in INDEX_RECORD.iter_unpack(chunk[:usable]):
+                    # Skip entries whose line never made it to disk
+                    if offset + length <= log_size:
+                        index.add(user_id, timestamp, offset, length)
+        return index
+
+
+class SortedUsers:
+    # The user id column of a sorted index file, read on demand so bisect
+    # finds a user's records in O(log n) preads without parsing the file
+    def __init__(self, fd: int, count: int):
+        self.fd = fd
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, position: int) -> int:
+        offset = SORTED_HEADER.size + position * INDEX_RECORD.size
+        return INDEX_RECORD.unpack(os.pread(self.fd, INDEX_RECORD.size, offset))[0]
+
+
+def select(lines: Lines, limit: Optional[int], since: Optional[float]) -> Lines:
+    # The newest `limit` of a user's lines in one segment at or after `since`
+    timestamps, offsets, lengths = lines
+    start = bisect_left(timestamps, since) if since is not None else 0
+    if limit is not None:
+        start = max(start, len(offsets) - limit)
+    return timestamps[start:], offsets[start:], lengths[start:]
+
+
+def legacy_timestamp(line: str) -> Optional[float]:
+    # Lines of the old logs/user_{id}.log files start with the local time in
+    # logging's default format, or carry it as "time" when LOG_JSON was on
+    try:
+        if line.startswith("{"):
+            line = json.loads(line)["time"]
+        return time.mktime(datetime.strptime(line[:19], "%Y-%m-%d %H:%M:%S").timetuple())
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class LogStore:
+    # Append-only log segments under logs/segments/ with a fixed-width sidecar
+    # index per segment. Reading a user's lines looks up their positions in
+    # the index and preads just those bytes, so the cost depends on how many
+    # lines are requested, not on how many the user (or everyone) has
+    # written. Segments roll over at LOG_SEGMENT_SIZE bytes and the oldest are
+    # deleted once the total exceeds LOG_RETENTION_SIZE.
+    #
+    # The active segment's index lives in memory. When a segment is sealed its
+    # index is rewritten sorted by user (.uidx), so looking a user up in an
+    # old segment is a binary search, and segments they never wrote to cost a
+    # few preads. Reads only hold the append lock while copying the active
+    # segment's entries, never while touching sealed segments.
+    #
+    # Per-user files from before the segment store (logs/user_{id}.log) are
+    # read as the oldest segment.
+
+    def __init__(
+        self,
+        directory: str = "logs/segments",
+        segment_size: int = LOG_SEGMENT_SIZE,
+        retention_size: int = LOG_RETENTION_SIZE,
+        legacy_directory: str = "logs",
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.retention_size = retention_size
+        self.legacy_directory = legacy_directory
+        self._lock = threading.Lock()
+        self._seal_lock = threading.Lock()
+        self._segments: List[int] = []
+        # Sealed segments whose sorted index is still being written
+        self._sealing: Dict[int, SegmentIndex] = {}
+        self._active: Optional[int] = None
+        self._active_index = SegmentIndex()
+        self._log_file = None
+        self._index_file = None
+        self._size = 0
+
+    def _path(self, segment: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"{segment:010d}.{suffix}")
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".log")
+        )
+        if self._segments and os.path.getsize(self._path(self._segments[-1], "log")) < self.segment_size:
+            segment = self._segments[-1]
+            self._active_index = SegmentIndex.load(
+                self._path(segment, "idx"), os.path.getsize(self._path(segment, "log"))
+            )
+            self._open_active(segment)
+        else:
+            self._open_active(self._segments[-1] + 1 if self._segments else 1)
+
+    def _open_active(self, segment: int):
+        if segment not in self._segments:
+            self._segments.append(segment)
+            self._active_index = SegmentIndex()
+        self._active = segment
+        self._log_file = open(self._path(segment, "log"), "ab")
+        self._index_file = open(self._path(segment, "idx"), "ab")
+        self._size = self._log_file.tell()
+
+    def append(self, user_id: int, timestamp: float, line: str):
+        data = line.encode("utf-8") + b"\n"
+        sealed = None
+        with self._lock:
+            if self._log_file is None:
+                self.open()
+            offset = self._size
+            self._log_file.write(data)
+            self._index_file.write(INDEX_RECORD.pack(user_id, timestamp, offset, len(data)))
+            self._active_index.add(user_id, timestamp, offset, len(data))
+            self._size += len(data)
+            if self._size >= self.segment_size:
+                sealed = self._rotate()
+        if sealed is not None:
+            # Sorting a full segment's index takes a while; readers use the
+            # in-memory copy in _sealing until the file is in place
+            self._seal(sealed)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._log_file is not None:
+            # Lines first, so an index entry never points past the log's end
+            self._log_file.flush()
+            self._index_file.flush()
+
+    def _rotate(self) -> int:
+        sealed = self._active
+        self._close_active()
+        self._sealing[sealed] = self._active_index
+        self._open_active(sealed + 1)
+        total = sum(
+            os.path.getsize(self._path(segment, "log")) for segment in self._segments
+        )
+        while total > self.retention_size and len(self._segments) > 1:
+            oldest = self._segments.pop(0)
+            total -= os.path.getsize(self._path(oldest, "log"))
+            self._sealing.pop(oldest, None)
+            for suffix in ("log", "idx", "uidx"):
+                try:
+                    os.remove(self._path(oldest, suffix))
+                except FileNotFoundError:
+                    pass
+        return sealed
+
+    def _seal(self, segment: int):
+        with self._seal_lock:
+            index = self._sealing.get(segment)
+            if index is not None:
+                index.save_sorted(self._path(segment, "uidx"))
+        with self._lock:
+            self._sealing.pop(segment, None)
+
+    def _close_active(self):
+        if self._log_file is not None:
+            self._flush()
+            self._log_file.close()
+            self._index_file.close()
+            self._log_file = self._index_file = None
+
+    def close(self):
+        with self._lock:
+            self._close_active()
+
+    def _sealed_lines(
+        self, segment: int, user_id: int, limit: Optional[int]
+    ) -> Tuple[float, Optional[Lines]]:
+        # The segment's newest timestamp and the user's newest `limit` lines in it
+        path = self._path(segment, "uidx")
+        if not os.path.exists(path):
+            # Sealed before sorted indexes existed: build it once
+            with self._seal_lock:
+                if not os.path.exists(path):
+                    SegmentIndex.load(
+                        self._path(segment, "idx"), os.path.getsize(self._path(segment, "log"))
+                    ).save_sorted(path)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            last_timestamp, count = SORTED_HEADER.unpack(os.pread(fd, SORTED_HEADER.size, 0))
+            users = SortedUsers(fd, count)
+            start = bisect_left(users, user_id)
+            if start == count or users[start] != user_id:
+                return last_timestamp, None
+            end = bisect_left(users, user_id + 1, start)
+            if limit is not None:
+                start = max(start, end - limit)
+            data = os.pread(
+                fd,
+                (end - start) * INDEX_RECORD.size,
+                SORTED_HEADER.size + start * INDEX_RECORD.size,
+            )
+        finally:
+            os.close(fd)
+        lines = (array("d"), array("Q"), array("I"))
+        for _, timestamp, offset, length in INDEX_RECORD.iter_unpack(data):
+            lines[0].append(timestamp)
+            lines[1].append(offset)
+            lines[2].append(length)
+        return last_timestamp, lines
+
+    def _legacy_lines(self, user_id: int, limit: Optional[int], since: Optional[float]) -> List[str]:
+        path = os.path.join(self.legacy_directory, f"user_{user_id}.log")
+        try:
+            with open(path, "rb") as file:
+                if since is None and limit is not None:
+                    # Read backwards just far enough for `limit` lines
+                    file.seek(0, os.SEEK_END)
+                    position = file.tell()
+                    data = b""
+                    while position > 0 and data.count(b"\n") <= limit:
+                        step = min(position, 64 * 1024)
+                        position -= step
+                        file.seek(position)
+                        data = file.read(step) + data
+                else:
+                    data = file.read()
+        except FileNotFoundError:
+            return []
+        lines = data.decode("utf-8", "replace").splitlines()
+        if since is not None:
+            kept = []
+            keep = False
+            for line in lines:
+                timestamp = legacy_timestamp(line)
+                # Lines without a timestamp continue the previous record
+                if timestamp is not None:
+                    keep = timestamp >= since
+                if keep:
+                    kept.append(line)
+            lines = kept
+        if limit is not None:
+            lines = lines[-limit:] if limit else []
+        return lines
+
+    def read(
+        self, user_id: int, lines: Optional[int] = None, since: Optional[float] = None
+    ) -> List[str]:
+        # The newest `lines` lines of the user, or all lines at or after
+        # `since` (capped at `lines` if both are given), oldest first.
+        with self._lock:
+            if self._log_file is None:
+                self.open()
+            self._flush()
+            segments = list(reversed(self._segments))
+            sealing = dict(self._sealing)
+            active = self._active
+            active_last = self._active_index.last_timestamp
+            entry = self._active_index.users.get(user_id)
+            active_lines = select(entry, lines, since) if entry is not None else None
+
+        # Newest segment first; each chunk holds one segment's lines oldest first
+        chunks: List[List[str]] = []
+        found = 0
+        for segment in segments:
+            remaining = None if lines is None else lines - found
+            if remaining == 0:
+                break
+            try:
+                if segment == active:
+                    last_timestamp, selected = active_last, active_lines
+                elif segment in sealing:
+                    index = sealing[segment]
+                    entry = index.users.get(user_id)
+                    last_timestamp = index.last_timestamp
+                    selected = select(entry, remaining, since) if entry is not None else None
+                else:
+                    last_timestamp, entry = self._sealed_lines(segment, user_id, remaining)
+                    selected = select(entry, remaining, since) if entry is not None else None
+            except FileNotFoundError:
+                # Deleted by retention while we were reading
+                continue
+            # Segments are in time order, so this one and all older ones are
+            # entirely before `since`
+            if since is not None and last_timestamp and last_timestamp < since:
+                break
+            if selected is not None:
+                try:
+                    chunk = self._pread(segment, selected[1], selected[2])
+                except FileNotFoundError:
+                    # Deleted between the lookup and the read
+                    continue
+                chunks.append(chunk)
+                found += len(chunk)
+        else:
+            remaining = None if lines is None else lines - found
+            if remaining != 0:
+                chunks.append(self._legacy_lines(user_id, remaining, since))
+
+        return [line for chunk in reversed(chunks) for line in chunk]
+
+    def _pread(self, segment: int, offsets: array, lengths: array) -> List[str]:
+        fd = os.open(self._path(segment, "log"), os.O_RDONLY)
+        try:
+            return [
+                os.pread(fd, length, offset).decode("utf-8", "replace").rstrip("\n")
+                for offset, length in zip(offsets, lengths)
+            ]
+        finally:
+            os.close(fd)
+
+
+log_store = LogStore()
@@ -1,35 +1,155 @@
+import atexit
+import json
 import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler
+
 from colorama import init
-import os
+
+from config.settings import LOG_FLUSH_INTERVAL, LOG_FLUSH_RECORDS, LOG_JSON
+from logs.log_store import LogStore, log_store
 
 init(autoreset=True)
 
 log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if hasattr(record, "user_id"):
+            entry["user_id"] = record.user_id
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LogStoreHandler(logging.Handler):
+    # Appends per-user records to the segmented log store. Writes are
+    # buffered and flushed in batches by the listener thread rather than
+    # after every record.
+
+    def __init__(self, store: LogStore):
+        super().__init__(logging.INFO)
+        self.store = store
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            record.name = f"user_{record.user_id}"
+            self.store.append(record.user_id, record.created, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
+        super().close()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LogListener(threading.Thread):
+    # Drains the log queue on a background thread so the event loop never
+    # waits on disk. Buffers are flushed every LOG_FLUSH_RECORDS records or
+    # LOG_FLUSH_INTERVAL seconds, whichever comes first.
+
+    _stop_signal = object()
+
+    def __init__(self, log_queue: queue.Queue, console: logging.Handler, users: LogStoreHandler):
+        super().__init__(name="log-listener", daemon=True)
+        self.queue = log_queue
+        self.console = console
+        self.users = users
+
+    def run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                item = None
+            if item is self._stop_signal:
+                self.users.flush()
+                return
+            if isinstance(item, _FlushRequest):
+                self.users.flush()
+                pending, last_flush = 0, time.monotonic()
+                item.done.set()
+                continue
+            if item is not None:
+                if hasattr(item, "user_id"):
+                    self.users.handle(item)
+                    pending += 1
+                else:
+                    self.console.handle(item)
+            if pending and (
+                pending >= LOG_FLUSH_RECORDS
+                or time.monotonic() - last_flush >= LOG_FLUSH_INTERVAL
+            ):
+                self.users.flush()
+                pending, last_flush = 0, time.monotonic()
+
+    def stop(self):
+        self.queue.put(self._stop_signal)
+        self.join()
+
+
+formatter = JsonFormatter() if LOG_JSON else logging.Formatter(log_format)
+
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+console_handler.setFormatter(formatter)
+
+user_store_handler = LogStoreHandler(log_store)
+user_store_handler.setFormatter(formatter)
+
+log_queue: queue.Queue = queue.Queue()
+queue_handler = QueueHandler(log_queue)
+listener = LogListener(log_queue, console_handler, user_store_handler)
+
 # Configure general logger
 logger = logging.getLogger("FakeDetailsGenLogs")
 logger.setLevel(logging.INFO)
+logger.addHandler(queue_handler)
 
-# Console handler with colorized output
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(logging.Formatter(log_format))
-logger.addHandler(console_handler)
-
-def setup_logger(user_id: int):
-    log_directory = "logs"
-    if not os.path.exists(log_directory):
-        os.makedirs(log_directory)
-    log_file_path = f"{log_directory}/user_{user_id}.log"
-    file_handler = logging.FileHandler(log_file_path, mode='a')
-    file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(logging.Formatter(log_format))
-    
-    user_logger = logging.getLogger(f"user_{user_id}")
-    if not user_logger.handlers:
-        user_logger.addHandler(file_handler)
-    user_logger.propagate = False  # Prevent double logging
-
-
-def get_user_logger(user_id: int) -> logging.Logger:
-    return logging.getLogger(f"user_{user_id}")
+# All per-user records go through one logger; the user id travels on the
+# record and picks the file, so no Logger object is created per user.
+users_logger = logging.getLogger("FakeDetailsGenUsers")
+users_logger.setLevel(logging.INFO)
+users_logger.addHandler(queue_handler)
+users_logger.propagate = False  # Prevent double logging
+
+listener.start()
+
+
+def get_user_logger(user_id: int) -> logging.LoggerAdapter:
+    return logging.LoggerAdapter(users_logger, {"user_id": user_id})
+
+
+def flush_logs(timeout: float = 5.0):
+    # Blocks until everything queued so far is on disk
+    request = _FlushRequest()
+    log_queue.put(request)
+    request.done.wait(timeout)
+
+
+def stop_logging():
+    if listener.is_alive():
+        listener.stop()
+        user_store_handler.close()
+
+
+atexit.register(stop_logging)
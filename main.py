@@ -1,6 +1,121 @@
-from handlers.commands import app
+import asyncio
+
+from config.settings import (
+    PREFETCH_SNAPSHOT_PATH,
+    PROFILE_API_ENABLED,
+    PROVIDER_CACHE_SIZE,
+    WARM_LOCALES,
+)
 from logs.logger import logger
+from utils.engine import generation_engine
+from utils.metrics import mark_startup, metrics_server, monitor_loop_lag, register_gauge
 
-if __name__ == "__main__":
+# Spawned generation workers import this module again as __mp_main__, so
+# Pyrogram, the handlers and the bot's services are imported inside the
+# functions below and only the bot process pays for them.
+
+
+def warm_locales(busy=()):
+    # Configured locales first, then the ones in demand before the restart
+    from handlers.commands import LOCALES
+
+    available = {locale.value: locale for locale in LOCALES.values()}
+    locales = [available[value] for value in WARM_LOCALES if value in available]
+    locales += [locale for locale in busy if locale not in locales]
+    return locales[:PROVIDER_CACHE_SIZE]
+
+
+def register_runtime_gauges():
+    from utils.database import write_buffer
+    from utils.inline_cache import inline_cache
+    from utils.prefetch import profile_pool
+    from utils.sender import sender
+
+    register_gauge(
+        "bot_write_queue_depth",
+        "Profiles waiting to be written to storage",
+        lambda: {(): write_buffer.metrics()["queue_depth"]},
+    )
+    register_gauge(
+        "bot_send_queue_depth",
+        "Outgoing Telegram calls waiting for a rate-limit slot",
+        lambda: {(): sender.queue_depth()},
+    )
+    register_gauge(
+        "bot_generation_pending",
+        "Generation jobs submitted to the worker pool",
+        lambda: {(): generation_engine.pending},
+    )
+    register_gauge(
+        "bot_prefetch_fill",
+        "Ready profiles buffered per locale",
+        lambda: {(locale,): stats["fill"] for locale, stats in profile_pool.stats().items()},
+        ("locale",),
+    )
+    register_gauge(
+        "bot_prefetch_miss_rate",
+        "Share of requests that found the locale's buffer empty",
+        lambda: {(locale,): stats["miss_rate"] for locale, stats in profile_pool.stats().items()},
+        ("locale",),
+    )
+    register_gauge(
+        "bot_inline_results",
+        "Pre-rendered inline results cached per locale",
+        lambda: {(locale,): size for locale, size in inline_cache.stats().items()},
+        ("locale",),
+    )
+
+
+async def main():
+    from pyrogram import idle
+
+    from handlers.commands import LOCALES, app
+    from utils.database import ensure_indexes, storage, write_buffer
+    from utils.inline_cache import inline_cache
+    from utils.prefetch import profile_pool
+    from utils.profile_api import profile_api
+    from utils.sender import sender
+    from utils.session_store import session_store
+    from utils.uniqueness import unique_filters
+
+    busy = profile_pool.load_snapshot(PREFETCH_SNAPSHOT_PATH) if PREFETCH_SNAPSHOT_PATH else []
+    warm = warm_locales(busy)
+    # Every generation worker loads its own providers for the warm locales
+    generation_engine.start(warm)
+    await ensure_indexes()
+    await session_store.open()
+    write_buffer.start()
+    await app.start()
+    sender.start()
+    await profile_pool.start(LOCALES.values())
+    inline_cache.start(LOCALES)
+    register_runtime_gauges()
+    await metrics_server.start()
+    if PROFILE_API_ENABLED:
+        # Shares the generation workers and their provider caches with the bot
+        await profile_api.start()
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+    mark_startup("ready")
     logger.info("Bot started")
-    app.run()
+    try:
+        await idle()
+    finally:
+        lag_monitor.cancel()
+        await profile_api.stop()
+        await unique_filters.close()
+        await metrics_server.stop()
+        await inline_cache.stop()
+        await profile_pool.stop()
+        if PREFETCH_SNAPSHOT_PATH:
+            profile_pool.save_snapshot(PREFETCH_SNAPSHOT_PATH)
+        await sender.stop()
+        await app.stop()
+        await write_buffer.stop()
+        await storage.close()
+        generation_engine.shutdown()
+
+
+if __name__ == "__main__":
+    from handlers.commands import app
+
+    app.run(main())
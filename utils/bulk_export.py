@@ -0,0 +1,124 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import time
+from datetime import date
+from tempfile import SpooledTemporaryFile
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional
+
+from mimesis.enums import Locale
+
+from config.settings import (
+    BULK_BATCH_SIZE,
+    BULK_DAILY_QUOTA,
+    BULK_MAX_CONCURRENT,
+    BULK_PROGRESS_INTERVAL,
+    BULK_SPOOL_SIZE,
+)
+from utils.details_generator import generate_details_batch
+from utils.uniqueness import BloomFilter, ensure_unique
+
+BULK_FORMATS = ("csv", "jsonl")
+
+
+class BulkQuota:
+    # Records each user may export per day, plus one running job per user.
+    # Usage is kept for the current day only and dropped when the date changes.
+
+    def __init__(self, daily_limit: int = BULK_DAILY_QUOTA):
+        self.daily_limit = daily_limit
+        self.day = date.today()
+        self.used: Dict[int, int] = {}
+        self.active = set()
+
+    def _roll_day(self):
+        if self.day != date.today():
+            self.day = date.today()
+            self.used.clear()
+
+    def remaining(self, user_id: int) -> int:
+        self._roll_day()
+        return max(0, self.daily_limit - self.used.get(user_id, 0))
+
+    def reserve(self, user_id: int, count: int) -> bool:
+        if user_id in self.active or count > self.remaining(user_id):
+            return False
+        self.used[user_id] = self.used.get(user_id, 0) + count
+        self.active.add(user_id)
+        return True
+
+    def release(self, user_id: int, unused: int = 0):
+        self.active.discard(user_id)
+        if unused and user_id in self.used:
+            self.used[user_id] = max(0, self.used[user_id] - unused)
+
+
+class BulkExport:
+    # Rows are gzip-compressed as they are written into a spooled buffer,
+    # which stays in memory up to BULK_SPOOL_SIZE bytes and moves to a
+    # temporary file beyond that.
+
+    def __init__(self, file_format: str):
+        self.file_format = file_format
+        self.buffer = SpooledTemporaryFile(max_size=BULK_SPOOL_SIZE)
+        self._gzip = gzip.GzipFile(fileobj=self.buffer, mode="wb")
+        self._text = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+        self._csv = csv.writer(self._text) if file_format == "csv" else None
+        self._header_written = False
+        self.rows = 0
+
+    def write_columns(self, columns: Dict[str, List]):
+        keys = list(columns)
+        rows = zip(*columns.values())
+        if self._csv is not None:
+            if not self._header_written:
+                self._csv.writerow(keys)
+                self._header_written = True
+            self._csv.writerows(rows)
+        else:
+            self._text.writelines(
+                json.dumps(dict(zip(keys, row)), ensure_ascii=False) + "\n"
+                for row in rows
+            )
+        self.rows += len(columns[keys[0]]) if keys else 0
+
+    def finish(self) -> BinaryIO:
+        self._text.flush()
+        self._text.detach()
+        self._gzip.close()
+        self.buffer.seek(0)
+        return self.buffer
+
+    def close(self):
+        self.buffer.close()
+
+
+bulk_quota = BulkQuota()
+_bulk_slots: Optional[asyncio.Semaphore] = None
+
+
+async def generate_bulk(
+    locale: Locale,
+    count: int,
+    export: BulkExport,
+    progress: Callable[[int], Awaitable],
+    fields: str = "",
+    bloom: Optional[BloomFilter] = None,
+):
+    global _bulk_slots
+    if _bulk_slots is None:
+        _bulk_slots = asyncio.Semaphore(BULK_MAX_CONCURRENT)
+
+    async with _bulk_slots:
+        last_progress = time.monotonic()
+        while export.rows < count:
+            batch = min(BULK_BATCH_SIZE, count - export.rows)
+            columns = await generate_details_batch(locale, batch, fields)
+            if bloom is not None:
+                await ensure_unique(locale, columns, bloom)
+            export.write_columns(columns)
+            if time.monotonic() - last_progress >= BULK_PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await progress(export.rows)
@@ -1,21 +1,69 @@
-from datetime import datetime
-from typing import Dict
+import calendar
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from motor.motor_asyncio import AsyncIOMotorClient
+from config.settings import STORAGE_BACKEND
+from utils.details_generator import ProfileRef
+from utils.metrics import timed
+from utils.storage import STORAGE_BACKENDS, HistoryKey
+from utils.write_behind import WriteBehindBuffer
 
-from config.settings import DB_NAME, MONGO_URI
+# Connections are opened on first use, not at import
+storage = STORAGE_BACKENDS[STORAGE_BACKEND]()
+write_buffer = WriteBehindBuffer(storage)
 
-mongo_client = AsyncIOMotorClient(MONGO_URI)
-db = mongo_client[DB_NAME]
-users_collection = db["users"]
 
+async def save_profile_to_db(user_id: int, username: str, profile: ProfileRef):
+    # Only the seed tuple is stored; utils.details_generator.materialise
+    # rebuilds the details when history is viewed or exported.
+    document = {
+        "user_id": user_id,
+        "username": username,
+        "l": profile.locale,
+        "s": profile.seed,
+        "v": profile.version,
+        "y": profile.year,
+        "timestamp": datetime.now(),
+    }
+    if profile.fields:
+        document["f"] = profile.fields
+    await write_buffer.enqueue(document)
 
-async def save_details_to_db(user_id: int, username: str, details: Dict[str, str]):
-    await users_collection.insert_one(
-        {
-            "user_id": user_id,
-            "username": username,
-            "details": details,
-            "timestamp": datetime.now(),
-        }
-    )
+
+async def ensure_indexes():
+    await storage.open()
+
+
+def encode_history_key(entry: Dict[str, Any]) -> str:
+    timestamp = entry["timestamp"]
+    millis = calendar.timegm(timestamp.timetuple()) * 1000 + timestamp.microsecond // 1000
+    return f"{millis}_{entry['_id']}"
+
+
+def decode_history_key(key: str) -> HistoryKey:
+    millis, entry_id = key.split("_")
+    return datetime(1970, 1, 1) + timedelta(milliseconds=int(millis)), entry_id
+
+
+async def fetch_history_page(
+    user_id: int,
+    limit: int,
+    before: Optional[HistoryKey] = None,
+    after: Optional[HistoryKey] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    # Keyset pagination on (timestamp, _id): entries strictly older than
+    # `before` or strictly newer than `after`, closest to the key first.
+    # Returns the entries and whether more exist in that direction.
+    with timed("storage"):
+        entries = await storage.history_page(user_id, limit + 1, before, after)
+    return entries[:limit], len(entries) > limit
+
+
+def export_history_batches(
+    user_id: int,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    batch_size: int,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    # The user's history newest first, batch_size entries at a time
+    return storage.export_batches(user_id, since, until, batch_size)
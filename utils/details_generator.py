@@ -1,21 +1,44 @@
+import functools
 import random
+import re
+import time
+import unicodedata
 from datetime import datetime
-from typing import Dict
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
 
-from mimesis import Generic
 from mimesis.enums import Gender, Locale
-from mimesis.providers.finance import Finance
+from mimesis.random import Random
 
+from utils.engine import generation_engine
+from utils.metrics import generation_seconds, observe_stage
+from utils.provider_cache import current_registry
 
-async def generate_details(locale: Locale) -> Dict[str, str]:
-    generic = Generic(locale)
-    gender = random.choice([Gender.MALE, Gender.FEMALE])
-    finance_business_data_gen = Finance(locale)
+# Bump when the fields or the order of draws change, and keep the previous
+# builder in GENERATORS so stored profiles still come back identical. Output
+# also depends on mimesis' bundled datasets, so upgrade mimesis deliberately.
+GENERATOR_VERSION = 2
+
+
+class ProfileRef(NamedTuple):
+    # Everything needed to rebuild a profile exactly; this is what history
+    # stores. fields is a compiled template, "" meaning every field.
+    locale: str
+    seed: int
+    version: int
+    year: int
+    fields: str = ""
+
+
+def _build_v1(locale: Locale, seed: int, year: int, fields: str = "") -> Dict[str, str]:
+    generic, finance_business_data_gen = current_registry().get(locale)
+    for provider in (generic.person, generic.address, generic.datetime, finance_business_data_gen):
+        provider.random = Random(seed)
+    draw = random.Random(seed)
+    gender = draw.choice([Gender.MALE, Gender.FEMALE])
     first_name = generic.person.first_name(gender=gender)
     last_name = generic.person.last_name(gender=gender)
-    current_year = datetime.now().year
-    age = random.randint(18, 50)
-    birth_year = current_year - age
+    age = draw.randint(18, 50)
+    birth_year = year - age
     birth_date = generic.datetime.date(start=birth_year, end=birth_year).strftime(
         "%Y-%m-%d"
     )
@@ -45,3 +68,227 @@ async def generate_details(locale: Locale) -> Dict[str, str]:
     }
 
     return details
+
+
+class ProfileContext:
+    # Evaluates one profile's fields on demand. A field is computed the first
+    # time it is read, so dependent fields (Full Name -> First Name -> gender,
+    # Birth Date -> Age) pull in only what they use and nothing else runs.
+    # Every provider a profile touches draws from the one stream seeded for
+    # it: seeding a Mersenne Twister costs as much as several fields, so it
+    # happens once per profile rather than once per provider.
+
+    __slots__ = ("locale", "year", "random", "attempt", "values", "_generators", "_providers")
+
+    def __init__(self, locale: Locale, seed: int, year: int, attempt: int = 0):
+        self.locale = locale
+        self.year = year
+        self.random = Random(seed)
+        # Above 0 when redrawing a field that collided (see refresh_field)
+        self.attempt = attempt
+        self.values: Dict[str, Any] = {}
+        self._generators = None
+        self._providers: Dict[str, Any] = {}
+
+    def __getitem__(self, field: str) -> Any:
+        try:
+            return self.values[field]
+        except KeyError:
+            value = self.values[field] = FIELDS[field](self)
+            return value
+
+    def provider(self, name: str) -> Any:
+        provider = self._providers.get(name)
+        if provider is None:
+            if self._generators is None:
+                self._generators = current_registry().get(self.locale)
+            generic, finance = self._generators
+            provider = finance if name == "finance" else getattr(generic, name)
+            provider.random = self.random
+            self._providers[name] = provider
+        return provider
+
+
+def _username(profile: ProfileContext) -> str:
+    # Built from the name when it has a Latin spelling, otherwise mimesis'
+    # own word-based username. Each redraw after a collision allows one more
+    # digit, so a crowded name still finds a free username quickly.
+    name = f"{profile['First Name']}.{profile['Last Name']}"
+    base = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().lower()
+    base = re.sub(r"[^a-z.]", "", base).strip(".")
+    if len(base) < 3:
+        username = profile.provider("person").username()
+        if profile.attempt:
+            username += str(profile.random.randint(1, 10 ** (profile.attempt + 1) - 1))
+        return username
+    return f"{base}{profile.random.randint(1, 10 ** (profile.attempt + 2) - 1)}"
+
+
+def _birth_date(profile: ProfileContext) -> str:
+    birth_year = profile.year - profile["Age"]
+    return profile.provider("datetime").date(start=birth_year, end=birth_year).strftime("%Y-%m-%d")
+
+
+# Field name -> how to compute it, in display order. Names starting with "_"
+# are intermediate values that never appear in a profile.
+FIELDS: Dict[str, Callable[[ProfileContext], Any]] = {
+    "_gender": lambda p: p.random.choice([Gender.MALE, Gender.FEMALE]),
+    "Full Name": lambda p: f"{p['First Name']} {p['Last Name']}",
+    "First Name": lambda p: p.provider("person").first_name(gender=p["_gender"]),
+    "Last Name": lambda p: p.provider("person").last_name(gender=p["_gender"]),
+    "Age": lambda p: p.random.randint(18, 50),
+    "Birth Date": _birth_date,
+    "Sex": lambda p: p.provider("person").sex(),
+    "University": lambda p: p.provider("person").university(),
+    "Street Name": lambda p: p.provider("address").street_name(),
+    "Street Number": lambda p: p.provider("address").street_number(),
+    "State": lambda p: p.provider("address").state(),
+    "City": lambda p: p.provider("address").city(),
+    "Country": lambda p: p.provider("address").default_country(),
+    "Postal Code": lambda p: p.provider("address").postal_code(),
+    "Company": lambda p: p.provider("finance").company(),
+    "Phone Number": lambda p: p.provider("person").telephone(),
+    "Occupation": lambda p: p.provider("person").occupation(),
+    "Nationality": lambda p: p.provider("person").nationality(),
+    "Language": lambda p: p.provider("person").language(),
+    "Username": _username,
+    "Password": lambda p: p.provider("person").password(),
+    "Weight": lambda p: f"{p.provider('person').weight()} kg",
+    "Height": lambda p: f"{p.provider('person').height()} cm",
+}
+
+PROFILE_FIELDS = tuple(field for field in FIELDS if not field.startswith("_"))
+
+# What /template accepts: every field as snake_case plus a few groups
+TEMPLATE_ALIASES: Dict[str, Tuple[str, ...]] = {
+    field.lower().replace(" ", "_"): (field,) for field in PROFILE_FIELDS
+}
+TEMPLATE_ALIASES.update(
+    {
+        "name": ("Full Name",),
+        "birthday": ("Birth Date",),
+        "phone": ("Phone Number",),
+        "zip": ("Postal Code",),
+        "street": ("Street Name", "Street Number"),
+        "address": ("Street Name", "Street Number", "City", "State", "Postal Code", "Country"),
+    }
+)
+
+
+def compile_template(spec: str) -> str:
+    # "name, phone,address" -> the selected fields in display order, joined
+    # with commas; this string is what sessions and history store
+    selected = set()
+    for alias in filter(None, re.split(r"[\s,]+", spec.lower())):
+        if alias not in TEMPLATE_ALIASES:
+            raise ValueError(f"Unknown field: {alias}")
+        selected.update(TEMPLATE_ALIASES[alias])
+    if not selected:
+        raise ValueError("No fields given")
+    if len(selected) == len(PROFILE_FIELDS):
+        return ""
+    return ",".join(field for field in PROFILE_FIELDS if field in selected)
+
+
+@functools.lru_cache(maxsize=256)
+def template_fields(fields: str) -> Tuple[str, ...]:
+    return tuple(fields.split(",")) if fields else PROFILE_FIELDS
+
+
+def _build_v2(locale: Locale, seed: int, year: int, fields: str = "") -> Dict[str, Any]:
+    profile = ProfileContext(locale, seed, year)
+    return {field: profile[field] for field in template_fields(fields)}
+
+
+GENERATORS = {1: _build_v1, 2: _build_v2}
+
+
+def new_profile_ref(locale: Locale, fields: str = "") -> ProfileRef:
+    return ProfileRef(
+        locale.value, random.getrandbits(63), GENERATOR_VERSION, datetime.now().year, fields
+    )
+
+
+def build_details(locale: Locale, fields: str = "") -> Dict[str, str]:
+    return build_profile(locale, fields)[1]
+
+
+def build_profile(locale: Locale, fields: str = "") -> Tuple[ProfileRef, Dict[str, str]]:
+    profile = new_profile_ref(locale, fields)
+    return profile, GENERATORS[profile.version](
+        locale, profile.seed, profile.year, profile.fields
+    )
+
+
+def rebuild_details(profiles: List[ProfileRef]) -> List[Dict[str, str]]:
+    return [
+        GENERATORS[profile.version](
+            Locale(profile.locale), profile.seed, profile.year, profile.fields
+        )
+        for profile in profiles
+    ]
+
+
+def refresh_field(locale: Locale, details: Dict[str, Any], field: str, attempt: int = 1) -> Any:
+    # Draws a new value for one field of an existing profile; the fields it
+    # depends on keep their values, so a new username still matches the name
+    profile = ProfileContext(locale, random.getrandbits(63), datetime.now().year, attempt)
+    profile.values.update(details)
+    profile.values.pop(field, None)
+    return profile[field]
+
+
+def refresh_fields(
+    locale: Locale, requests: List[Tuple[Dict[str, Any], str]], attempt: int = 1
+) -> List[Any]:
+    # refresh_field for a batch of (details, field) pairs in one worker call
+    return [refresh_field(locale, details, field, attempt) for details, field in requests]
+
+
+def build_details_batch(locale: Locale, count: int, fields: str = "") -> Dict[str, List]:
+    # Column-oriented so a batch crossing the process boundary pickles each
+    # field name once rather than once per profile.
+    columns: Dict[str, List] = {}
+    for _ in range(count):
+        for key, value in build_details(locale, fields).items():
+            columns.setdefault(key, []).append(value)
+    return columns
+
+
+async def generate_profile(
+    locale: Locale, fields: str = ""
+) -> Tuple[ProfileRef, Dict[str, str]]:
+    started = time.perf_counter()
+    profile = await generation_engine.run(build_profile, locale, fields)
+    elapsed = time.perf_counter() - started
+    observe_stage("generation", elapsed)
+    generation_seconds.observe(elapsed, locale.value)
+    return profile
+
+
+async def generate_details_batch(
+    locale: Locale, count: int, fields: str = ""
+) -> Dict[str, List]:
+    started = time.perf_counter()
+    columns = await generation_engine.run(build_details_batch, locale, count, fields)
+    observe_stage("generation", time.perf_counter() - started)
+    return columns
+
+
+async def materialise(entries: List[Dict[str, Any]]):
+    # Fills in "details" for history entries stored as a ProfileRef. Entries
+    # saved before profiles were stored by seed already carry their details.
+    pending = [entry for entry in entries if "details" not in entry]
+    if not pending:
+        return
+    started = time.perf_counter()
+    details = await generation_engine.run(
+        rebuild_details,
+        [
+            ProfileRef(entry["l"], entry["s"], entry["v"], entry["y"], entry.get("f", ""))
+            for entry in pending
+        ],
+    )
+    observe_stage("generation", time.perf_counter() - started)
+    for entry, entry_details in zip(pending, details):
+        entry["details"] = entry_details
@@ -0,0 +1,89 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+from mimesis.enums import Locale
+
+from config.settings import (
+    GENERATION_EXECUTOR,
+    GENERATION_MAX_PENDING,
+    GENERATION_WORKERS,
+)
+from logs.logger import logger
+from utils.provider_cache import init_worker_registry
+
+
+class GenerationEngine:
+    # Runs blocking mimesis work on a pool of worker processes (or threads) so
+    # the event loop only awaits futures. At most max_pending jobs are handed to
+    # the executor at once; further callers wait on the semaphore instead of
+    # piling up an unbounded backlog inside the pool.
+
+    def __init__(
+        self,
+        mode: str = GENERATION_EXECUTOR,
+        workers: int = GENERATION_WORKERS,
+        max_pending: int = GENERATION_MAX_PENDING,
+    ):
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self, warm_locales: Iterable[Locale] = ()):
+        if self._executor is not None:
+            return
+        warm_locales = tuple(warm_locales)
+        if self.mode == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="generation",
+                initializer=init_worker_registry,
+                initargs=(warm_locales,),
+            )
+        else:
+            # Spawn rather than fork: the parent already runs Pyrogram's
+            # threads and event loop, which must not be copied into workers.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker_registry,
+                initargs=(warm_locales,),
+            )
+        # Both pools only start a worker when a job finds none idle. Submit one
+        # no-op per worker so they all spawn, import and warm their providers
+        # in the background now rather than in front of the first users.
+        for _ in range(self.workers):
+            self._executor.submit(os.getpid)
+        self._slots = asyncio.Semaphore(self.max_pending)
+        logger.info(f"Generation engine started: {self.workers} {self.mode} workers")
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None:
+            return func(*args)
+        async with self._slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, func, *args)
+            finally:
+                self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._slots = None
+        logger.info("Generation engine stopped")
+
+
+generation_engine = GenerationEngine()
@@ -0,0 +1,127 @@
+import abc
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from config.settings import EXPORT_BATCH_SIZE, EXPORT_SPOOL_SIZE
+from utils.database import export_history_batches
+from utils.details_generator import PROFILE_FIELDS, materialise
+from utils.renderer import render_profile
+
+EXPORT_FORMATS = ("html", "csv", "jsonl")
+
+class EncodingWriter(io.TextIOBase):
+    # Text front for the uncompressed spool. SpooledTemporaryFile only has the
+    # io interface TextIOWrapper needs from Python 3.11, so encode here instead.
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self.raw.write(text.encode("utf-8"))
+        return len(text)
+
+
+class HistoryWriter(abc.ABC):
+    def __init__(self, text: io.TextIOBase):
+        self.text = text
+
+    def begin(self):
+        pass
+
+    @abc.abstractmethod
+    def write(self, entry: Dict[str, Any]):
+        ...
+
+    def end(self):
+        pass
+
+
+class HtmlHistoryWriter(HistoryWriter):
+    def begin(self):
+        self.text.write("<html><body><h2>Generated Details History</h2>")
+
+    def write(self, entry: Dict[str, Any]):
+        self.text.write(
+            render_profile(entry["details"], "html", f"Generated on: {entry['timestamp']}")
+        )
+
+    def end(self):
+        self.text.write("</body></html>")
+
+
+class CsvHistoryWriter(HistoryWriter):
+    def __init__(self, text: io.TextIOBase):
+        super().__init__(text)
+        self.csv = csv.writer(text)
+
+    def begin(self):
+        # Entries made with different /template selections share one header
+        self.csv.writerow(["Generated on", *PROFILE_FIELDS])
+
+    def write(self, entry: Dict[str, Any]):
+        details = entry["details"]
+        self.csv.writerow([entry["timestamp"], *(details.get(key, "") for key in PROFILE_FIELDS)])
+
+
+class JsonlHistoryWriter(HistoryWriter):
+    def write(self, entry: Dict[str, Any]):
+        record = {"timestamp": entry["timestamp"].isoformat(), **entry["details"]}
+        self.text.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+HISTORY_WRITERS = {
+    "html": HtmlHistoryWriter,
+    "csv": CsvHistoryWriter,
+    "jsonl": JsonlHistoryWriter,
+}
+
+
+async def write_batch(writer: HistoryWriter, batch: List[Dict[str, Any]]):
+    await materialise(batch)
+    for entry in batch:
+        writer.write(entry)
+
+
+async def export_history(
+    user_id: int,
+    file_format: str = "html",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    compress: bool = False,
+):
+    # Streams the user's history, newest first, from the cursor in batches of
+    # EXPORT_BATCH_SIZE into a spooled buffer that stays in memory up to
+    # EXPORT_SPOOL_SIZE bytes and moves to an anonymous temporary file beyond
+    # that. Returns the rewound buffer, which the caller must close, and the
+    # number of entries written.
+    buffer = SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    if compress:
+        raw = gzip.GzipFile(fileobj=buffer, mode="wb")
+        text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    else:
+        text = EncodingWriter(buffer)
+    writer = HISTORY_WRITERS[file_format](text)
+    count = 0
+    try:
+        writer.begin()
+        async for batch in export_history_batches(user_id, since, until, EXPORT_BATCH_SIZE):
+            await write_batch(writer, batch)
+            count += len(batch)
+        writer.end()
+        if compress:
+            text.flush()
+            text.detach()
+            raw.close()
+    except BaseException:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer, count
@@ -0,0 +1,176 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from logs.logger import logger
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "peer")
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str], peer: str):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.peer = peer
+
+
+class Response:
+    def __init__(
+        self,
+        body: bytes = b"",
+        status: int = 200,
+        content_type: str = "text/plain; charset=utf-8",
+    ):
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+
+    async def send(self, writer: asyncio.StreamWriter, keep_alive: bool):
+        writer.write(
+            _head(self.status, self.content_type, keep_alive)
+            + f"Content-Length: {len(self.body)}\r\n\r\n".encode()
+            + self.body
+        )
+        await writer.drain()
+
+
+class StreamingResponse(Response):
+    # Sends the body as it is produced, one HTTP chunk per item of chunks.
+    # Each chunk waits for drain() before the next is pulled, so a slow
+    # client holds back the producer instead of filling memory. on_close
+    # runs once the stream ends, however it ends.
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[bytes],
+        status: int = 200,
+        content_type: str = "application/octet-stream",
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(b"", status, content_type)
+        self.chunks = chunks
+        self.on_close = on_close
+
+    async def send(self, writer: asyncio.StreamWriter, keep_alive: bool):
+        try:
+            writer.write(
+                _head(self.status, self.content_type, keep_alive)
+                + b"Transfer-Encoding: chunked\r\n\r\n"
+            )
+            async for chunk in self.chunks:
+                if chunk:
+                    writer.write(b"%x\r\n%b\r\n" % (len(chunk), chunk))
+                    await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            if hasattr(self.chunks, "aclose"):
+                await self.chunks.aclose()
+            if self.on_close is not None:
+                self.on_close()
+
+
+def _head(status: int, content_type: str, keep_alive: bool) -> bytes:
+    return (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    ).encode()
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    # A small HTTP/1.1 server on asyncio streams for the bot's own endpoints,
+    # so they run on the bot's event loop without another web framework.
+    # Connections are kept alive between requests unless the client asks
+    # otherwise or stays idle for idle_timeout seconds.
+
+    def __init__(self, host: str, port: int, idle_timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, method: str, path: str):
+        def register(handler: Handler) -> Handler:
+            self.routes[(method, path)] = handler
+            return handler
+
+        return register
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        peer = peer[0] if peer else ""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), self.idle_timeout
+                    )
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await Response(b"Bad request", 400).send(writer, False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and version == "HTTP/1.1"
+                )
+
+                request = Request(method, target, headers, peer)
+                handler = self.routes.get((method, request.path))
+                if handler is None:
+                    known = any(path == request.path for _, path in self.routes)
+                    response = Response(b"Not found", 405 if known else 404)
+                else:
+                    try:
+                        response = await handler(request)
+                    except Exception as e:
+                        logger.error(f"Error serving {method} {request.path}: {e}")
+                        response = Response(b"Internal server error", 500)
+                await response.send(writer, keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        except Exception as e:
+            # A streamed body failed after its headers went out; closing the
+            # connection leaves the client with a truncated chunked body
+            logger.error(f"Error sending response to {peer}: {e}")
+        finally:
+            writer.close()
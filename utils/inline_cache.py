@@ -0,0 +1,138 @@
+import asyncio
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from mimesis.enums import Locale
+from pyrogram.enums import ParseMode
+from pyrogram.types import InlineQueryResultArticle, InputTextMessageContent
+
+from config.settings import INLINE_CACHE_SIZE, INLINE_REFRESH_INTERVAL
+from logs.logger import logger
+from utils.details_generator import ProfileRef, generate_profile
+from utils.prefetch import profile_pool
+from utils.renderer import render_profile
+
+
+def build_locale_index(locales: Dict[str, Locale]) -> Dict[str, List[Locale]]:
+    # Maps every prefix of a locale code ("d", "de", "de-", "de-a") and of
+    # each word of its country name ("ger", "austrian") to the matching
+    # locales, in LOCALES order, so an inline query resolves with one lookup.
+    # An exact code always comes first: "en" is English (US), not English (AU).
+    index: Dict[str, List[Locale]] = {}
+    for name, locale in locales.items():
+        keys = {locale.value, locale.value.replace("-", "_"), *re.findall(r"\w+", name.lower())}
+        for key in keys:
+            for end in range(1, len(key) + 1):
+                bucket = index.setdefault(key[:end], [])
+                if locale not in bucket:
+                    bucket.append(locale)
+    for locale in locales.values():
+        for code in (locale.value, locale.value.replace("-", "_")):
+            bucket = index[code]
+            bucket.remove(locale)
+            bucket.insert(0, locale)
+    return index
+
+
+def encode_result_id(profile: ProfileRef) -> str:
+    return f"{profile.locale}:{profile.seed}:{profile.version}:{profile.year}"
+
+
+def decode_result_id(result_id: str) -> Optional[ProfileRef]:
+    try:
+        locale, seed, version, year = result_id.split(":")
+        return ProfileRef(locale, int(seed), int(version), int(year))
+    except ValueError:
+        return None
+
+
+class InlineResultCache:
+    # Pre-rendered inline results per locale, so answering an inline query is
+    # a list slice. Each locale's list is rebuilt in the background once it is
+    # older than INLINE_REFRESH_INTERVAL; queries keep reading the old list
+    # until the new one is swapped in. Every locale is built at start-up; one
+    # queried before its build is done is answered from the prefetch pool's
+    # ready-made profiles, never by generating while the user waits. At most
+    # one build runs per locale.
+
+    def __init__(self):
+        self.results: Dict[Locale, List[InlineQueryResultArticle]] = {}
+        self.built: Dict[Locale, float] = {}
+        self.countries: Dict[Locale, str] = {}
+        self._rebuilding: Dict[Locale, asyncio.Task] = {}
+
+    def start(self, locales: Dict[str, Locale]):
+        self.countries = {locale: name for name, locale in locales.items()}
+        for locale in locales.values():
+            self._schedule(locale)
+        logger.info(f"Inline result cache started, {len(self._rebuilding)} locales warming")
+
+    async def stop(self):
+        tasks = list(self._rebuilding.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._rebuilding.clear()
+
+    def page(
+        self, locale: Locale, offset: int, limit: int
+    ) -> Tuple[List[InlineQueryResultArticle], str]:
+        # May return fewer than `limit` results while the locale is still
+        # being built
+        end = min(offset + limit, INLINE_CACHE_SIZE)
+        results = self.results.get(locale, [])
+        if len(results) < end:
+            results = list(results)
+            while len(results) < end:
+                profile = profile_pool.pop(locale)
+                if profile is None:
+                    break
+                results.append(self._article(locale, *profile))
+            self.results[locale] = results
+            self._schedule(locale)
+        elif time.monotonic() - self.built.get(locale, 0.0) > INLINE_REFRESH_INTERVAL:
+            self._schedule(locale)
+        page = results[offset:end]
+        end = offset + len(page)
+        next_offset = str(end) if page and end < INLINE_CACHE_SIZE else ""
+        return page, next_offset
+
+    def stats(self) -> Dict[str, int]:
+        return {locale.value: len(results) for locale, results in self.results.items()}
+
+    def _article(
+        self, locale: Locale, profile: ProfileRef, details: Dict[str, str]
+    ) -> InlineQueryResultArticle:
+        country = self.countries.get(locale, locale.value)
+        return InlineQueryResultArticle(
+            title=details["Full Name"],
+            description=f"{country} · {details['City']} · {details['Occupation']}",
+            input_message_content=InputTextMessageContent(
+                render_profile(details), parse_mode=ParseMode.HTML
+            ),
+            id=encode_result_id(profile),
+        )
+
+    def _schedule(self, locale: Locale):
+        if locale not in self._rebuilding:
+            task = asyncio.create_task(self._rebuild(locale))
+            self._rebuilding[locale] = task
+            task.add_done_callback(lambda _: self._rebuilding.pop(locale, None))
+
+    async def _rebuild(self, locale: Locale):
+        try:
+            results = []
+            for _ in range(INLINE_CACHE_SIZE):
+                results.append(self._article(locale, *await generate_profile(locale)))
+                # Yield between profiles so rebuilds never starve handlers
+                await asyncio.sleep(0)
+            self.results[locale] = results
+            self.built[locale] = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error building inline results for {locale.value}: {e}")
+
+
+inline_cache = InlineResultCache()
@@ -0,0 +1,326 @@
+import abc
+import asyncio
+import functools
+import ipaddress
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as Tally
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config.settings import METRICS_HOST, METRICS_PORT, METRICS_PROFILE_ACCESS
+from logs.logger import logger
+from utils.http_server import HttpServer, Request, Response
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterable[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Gauge(Metric):
+    # Either set directly or computed at scrape time by a callback that
+    # returns {label values: value}
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), callback: Callable = None):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+    def samples(self):
+        values = self.values
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.error(f"Error collecting {self.name}: {e}")
+                values = {}
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        names = self.label_names + ("le",)
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {count}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+command_total = registry.register(
+    Counter("bot_commands_total", "Handled updates by command and outcome", ("command", "status"))
+)
+command_seconds = registry.register(
+    Histogram("bot_command_seconds", "Handler latency by command", ("command",))
+)
+stage_seconds = registry.register(
+    Histogram(
+        "bot_stage_seconds",
+        "Time spent per command and stage: generation, storage, render, send",
+        ("command", "stage"),
+    )
+)
+generation_seconds = registry.register(
+    Histogram("bot_generation_seconds", "Profile generation latency by locale", ("locale",))
+)
+api_profiles_total = registry.register(
+    Counter("bot_api_profiles_total", "Profiles streamed by the profile API", ("locale", "format"))
+)
+loop_lag_seconds = registry.register(
+    Histogram("bot_event_loop_lag_seconds", "Delay of scheduled callbacks on the event loop")
+)
+startup_seconds = registry.register(
+    Gauge(
+        "bot_startup_seconds",
+        "Seconds from process start to each startup phase: ready, first_update",
+        ("phase",),
+    )
+)
+open_fds = registry.register(
+    Gauge(
+        "process_open_fds",
+        "Open file descriptors",
+        callback=lambda: {(): len(os.listdir("/proc/self/fd"))},
+    )
+)
+
+
+def process_uptime() -> float:
+    # Seconds since the kernel started this process, so interpreter start-up
+    # and imports are included
+    with open("/proc/self/stat") as file:
+        started = int(file.read().rsplit(")", 1)[1].split()[19])
+    with open("/proc/uptime") as file:
+        uptime = float(file.read().split()[0])
+    return uptime - started / os.sysconf("SC_CLK_TCK")
+
+
+def mark_startup(phase: str):
+    # Records only the first time each phase is reached
+    if phase not in startup_seconds.values:
+        startup_seconds.set(round(process_uptime(), 3), phase)
+
+
+# The command whose handler is running, set by instrument(). Work done outside
+# any handler (prefetch refills, write-behind flushes) counts as "background".
+current_command: ContextVar[str] = ContextVar("current_command", default="background")
+
+
+def observe_stage(stage: str, seconds: float, command: Optional[str] = None):
+    stage_seconds.observe(seconds, command or current_command.get(), stage)
+
+
+def register_gauge(name: str, help_text: str, callback: Callable, labels: Sequence[str] = ()):
+    registry.register(Gauge(name, help_text, labels, callback))
+
+
+def instrument(command: str):
+    # Goes between the Pyrogram decorator and the handler. The wrapper stays
+    # a coroutine function so Pyrogram still awaits it on the event loop.
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            mark_startup("first_update")
+            token = current_command.set(command)
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                return await handler(*args, **kwargs)
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                command_seconds.observe(time.perf_counter() - started, command)
+                command_total.inc(command, status)
+                current_command.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag_seconds.observe(max(0.0, loop.time() - expected))
+
+
+def sample_stacks(seconds: float, interval: float) -> str:
+    # Poor man's sampling profiler: snapshots every thread's stack at a fixed
+    # interval and returns them in collapsed "frame;frame;frame count" form,
+    # ready for flamegraph tools.
+    stacks: Tally = Tally()
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(frames))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def is_loopback(peer: str) -> bool:
+    try:
+        return ipaddress.ip_address(peer).is_loopback
+    except ValueError:
+        return False
+
+
+# Held by the thread running the current /debug/profile sample
+_profiling = threading.Lock()
+
+
+def start_profile(seconds: float, interval: float) -> asyncio.Future:
+    # Samples on a dedicated thread rather than the default executor, which
+    # log flushes and the SQLite backends rely on, and releases _profiling
+    # when done even if the client has gone away
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(setter, value):
+        if not future.done():
+            setter(value)
+
+    def run():
+        try:
+            result = sample_stacks(seconds, interval)
+        except Exception as e:
+            loop.call_soon_threadsafe(deliver, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(deliver, future.set_result, result)
+        finally:
+            _profiling.release()
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+    return future
+
+
+metrics_server = HttpServer(METRICS_HOST, METRICS_PORT)
+
+
+@metrics_server.route("GET", "/metrics")
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(
+        registry.render().encode(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@metrics_server.route("GET", "/debug/profile")
+async def profile_endpoint(request: Request) -> Response:
+    if METRICS_PROFILE_ACCESS == "off" or (
+        METRICS_PROFILE_ACCESS != "any" and not is_loopback(request.peer)
+    ):
+        return Response(b"Profiling is not enabled for this client", 403)
+    try:
+        seconds = min(float(request.query.get("seconds", "5")), 60.0)
+        interval = max(float(request.query.get("interval", "0.01")), 0.001)
+    except ValueError:
+        return Response(b"seconds and interval must be numbers", 400)
+    if not _profiling.acquire(blocking=False):
+        return Response(b"A profile is already running", 409)
+    return Response((await start_profile(seconds, interval)).encode())
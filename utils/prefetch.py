@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from mimesis.enums import Locale
+
+from config.settings import (
+    PREFETCH_ADAPT_INTERVAL,
+    PREFETCH_DEMAND_WINDOW,
+    PREFETCH_HIGH_WATERMARK,
+    PREFETCH_LOW_WATERMARK,
+    PREFETCH_MAX_SIZE,
+    PREFETCH_MIN_SIZE,
+    PREFETCH_SNAPSHOT_MAX_AGE,
+)
+from logs.logger import logger
+from utils.details_generator import GENERATORS, ProfileRef, generate_profile
+
+
+Profile = Tuple[ProfileRef, Dict[str, str]]
+
+
+class LocaleBuffer:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.profiles: Deque[Profile] = deque(maxlen=capacity)
+        self.refill_needed = asyncio.Event()
+        self.demand = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def low_watermark(self) -> int:
+        return max(1, int(self.capacity * PREFETCH_LOW_WATERMARK))
+
+    @property
+    def high_watermark(self) -> int:
+        return max(1, int(self.capacity * PREFETCH_HIGH_WATERMARK))
+
+    def resize(self, capacity: int):
+        if capacity != self.capacity:
+            self.capacity = capacity
+            self.profiles = deque(self.profiles, maxlen=capacity)
+
+
+class ProfilePool:
+    # Ring buffers of ready-made profiles per locale. Handlers pop from the
+    # left in O(1); one background task per locale tops its buffer back up to
+    # the high watermark whenever a pop leaves it below the low watermark.
+
+    def __init__(self):
+        self.buffers: Dict[Locale, LocaleBuffer] = {}
+        self._tasks = []
+        self._last_adapt = time.monotonic()
+
+    async def start(self, locales: Iterable[Locale]):
+        for locale in locales:
+            buffer = self.buffers.get(locale)
+            if buffer is None:
+                buffer = self.buffers[locale] = LocaleBuffer(PREFETCH_MIN_SIZE)
+            buffer.refill_needed.set()
+            self._tasks.append(asyncio.create_task(self._refill(locale, buffer)))
+        self._tasks.append(asyncio.create_task(self._adapt_loop()))
+        logger.info(f"Profile prefetch started for {len(self.buffers)} locales")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def pop(self, locale: Locale) -> Optional[Profile]:
+        buffer = self.buffers.get(locale)
+        if buffer is None:
+            return None
+        buffer.demand += 1
+        if buffer.profiles:
+            profile = buffer.profiles.popleft()
+            buffer.hits += 1
+        else:
+            profile = None
+            buffer.misses += 1
+        if len(buffer.profiles) < buffer.low_watermark:
+            buffer.refill_needed.set()
+        return profile
+
+    async def get(self, locale: Locale) -> Profile:
+        profile = self.pop(locale)
+        if profile is None:
+            profile = await generate_profile(locale)
+        return profile
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for locale, buffer in self.buffers.items():
+            requests = buffer.hits + buffer.misses
+            stats[locale.value] = {
+                "fill": len(buffer.profiles),
+                "capacity": buffer.capacity,
+                "hits": buffer.hits,
+                "misses": buffer.misses,
+                "miss_rate": buffer.misses / requests if requests else 0.0,
+            }
+        return stats
+
+    def save_snapshot(self, path: str):
+        # Keeps each buffer's profiles, size and recent demand so a restarted
+        # bot can serve from full buffers before its workers are up
+        snapshot = {
+            "saved_at": time.time(),
+            "locales": {
+                locale.value: {
+                    "capacity": buffer.capacity,
+                    "demand": buffer.demand,
+                    "profiles": [[list(profile), details] for profile, details in buffer.profiles],
+                }
+                for locale, buffer in self.buffers.items()
+            },
+        }
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary = path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(snapshot, file, ensure_ascii=False)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.error(f"Error saving prefetch snapshot to {path}: {e}")
+            return
+        count = sum(len(buffer.profiles) for buffer in self.buffers.values())
+        logger.info(f"Saved {count} prefetched profiles to {path}")
+
+    def load_snapshot(self, path: str) -> List[Locale]:
+        # Refills the buffers from save_snapshot() before start() and returns
+        # the locales that were in demand, busiest first, for warming
+        try:
+            with open(path, encoding="utf-8") as file:
+                snapshot = json.load(file)
+            # Every profile is handed out once: drop the file so a crash
+            # before the next save cannot serve the same profiles again
+            os.remove(path)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading prefetch snapshot from {path}: {e}")
+            return []
+        age = time.time() - snapshot["saved_at"]
+        if age > PREFETCH_SNAPSHOT_MAX_AGE:
+            logger.info(f"Ignoring prefetch snapshot saved {age:.0f}s ago")
+            return []
+
+        year = datetime.now().year
+        demand = {}
+        for value, saved in snapshot["locales"].items():
+            if value not in Locale._value2member_map_:
+                continue
+            locale = Locale(value)
+            capacity = min(PREFETCH_MAX_SIZE, max(PREFETCH_MIN_SIZE, saved["capacity"]))
+            buffer = LocaleBuffer(capacity)
+            for fields, details in saved["profiles"]:
+                profile = ProfileRef(*fields)
+                # Ages are relative to the year a profile was drawn in
+                if profile.year == year and profile.version in GENERATORS:
+                    buffer.profiles.append((profile, details))
+            self.buffers[locale] = buffer
+            demand[locale] = saved["demand"]
+        count = sum(len(buffer.profiles) for buffer in self.buffers.values())
+        logger.info(f"Restored {count} prefetched profiles from {path}")
+        busy = [locale for locale, recent in demand.items() if recent >= 1]
+        return sorted(busy, key=demand.get, reverse=True)
+
+    async def _refill(self, locale: Locale, buffer: LocaleBuffer):
+        while True:
+            await buffer.refill_needed.wait()
+            buffer.refill_needed.clear()
+            try:
+                while len(buffer.profiles) < buffer.high_watermark:
+                    buffer.profiles.append(await generate_profile(locale))
+                    # Yield between profiles so refills never starve handlers
+                    await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error prefetching profiles for {locale.value}: {e}")
+
+    async def _adapt_loop(self):
+        while True:
+            await asyncio.sleep(PREFETCH_ADAPT_INTERVAL)
+            self._adapt()
+
+    def _adapt(self):
+        # Size each buffer to roughly the number of profiles requested over
+        # the demand window. Demand is a sum of pops decayed by elapsed/window
+        # on every pass, which settles at rate * window, so it already is the
+        # target; the decay also lets idle locales shrink back.
+        now = time.monotonic()
+        elapsed = max(now - self._last_adapt, 1e-3)
+        self._last_adapt = now
+        decay = max(0.0, 1.0 - elapsed / PREFETCH_DEMAND_WINDOW)
+        for buffer in self.buffers.values():
+            target = int(buffer.demand)
+            buffer.resize(min(PREFETCH_MAX_SIZE, max(PREFETCH_MIN_SIZE, target)))
+            buffer.demand *= decay
+            if len(buffer.profiles) < buffer.low_watermark:
+                buffer.refill_needed.set()
+
+
+profile_pool = ProfilePool()
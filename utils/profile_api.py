@@ -0,0 +1,150 @@
+import asyncio
+import csv
+import io
+import json
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+
+from mimesis.enums import Locale
+
+from config.settings import (
+    PROFILE_API_BATCH_SIZE,
+    PROFILE_API_CLIENT_CONCURRENCY,
+    PROFILE_API_HOST,
+    PROFILE_API_MAX_COUNT,
+    PROFILE_API_PIPELINE,
+    PROFILE_API_PORT,
+)
+from logs.logger import logger
+from utils.details_generator import build_details_batch, compile_template
+from utils.engine import generation_engine
+from utils.http_server import HttpServer, Request, Response, StreamingResponse
+from utils.metrics import api_profiles_total
+from utils.uniqueness import BloomFilter, ensure_unique, unique_filters
+
+API_FORMATS = {
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def encode_columns(columns: Dict[str, List], file_format: str, header: bool) -> bytes:
+    keys = list(columns)
+    rows = zip(*columns.values())
+    if file_format == "csv":
+        text = io.StringIO()
+        writer = csv.writer(text)
+        if header:
+            writer.writerow(keys)
+        writer.writerows(rows)
+        return text.getvalue().encode()
+    return "".join(
+        json.dumps(dict(zip(keys, row)), ensure_ascii=False) + "\n" for row in rows
+    ).encode()
+
+
+def build_encoded_batch(
+    locale: Locale, count: int, fields: str, file_format: str, header: bool
+) -> bytes:
+    # Runs on a generation worker: encoding there keeps the event loop free
+    # and sends one bytes object back instead of a dict per profile.
+    return encode_columns(build_details_batch(locale, count, fields), file_format, header)
+
+
+async def stream_profiles(
+    locale: Locale,
+    count: int,
+    fields: str,
+    file_format: str,
+    bloom: Optional[BloomFilter] = None,
+) -> AsyncIterator[bytes]:
+    # Keeps up to `depth` batches generating ahead of the client. A batch is
+    # only requested after the previous one was written and drained, so a
+    # slow reader throttles generation rather than buffering it. With a
+    # uniqueness filter, batches come back as columns and are checked and
+    # encoded here, in order, since the filter lives in this process.
+    depth = PROFILE_API_PIPELINE or generation_engine.workers
+    pending = deque()
+    requested = 0
+    try:
+        while requested < count or pending:
+            while requested < count and len(pending) < depth:
+                size = min(PROFILE_API_BATCH_SIZE, count - requested)
+                if bloom is None:
+                    job = generation_engine.run(
+                        build_encoded_batch, locale, size, fields, file_format, requested == 0
+                    )
+                else:
+                    job = generation_engine.run(build_details_batch, locale, size, fields)
+                pending.append((size, requested == 0, asyncio.ensure_future(job)))
+                requested += size
+            size, header, task = pending.popleft()
+            if bloom is None:
+                yield await task
+            else:
+                columns = await task
+                await ensure_unique(locale, columns, bloom)
+                yield encode_columns(columns, file_format, header)
+            api_profiles_total.inc(locale.value, file_format, amount=size)
+        if bloom is not None:
+            # Persist what this stream claimed before telling the client it is done
+            await unique_filters.flush()
+    finally:
+        for _, _, task in pending:
+            task.cancel()
+
+
+profile_api = HttpServer(PROFILE_API_HOST, PROFILE_API_PORT)
+_client_streams: Dict[str, int] = {}
+
+
+@profile_api.route("GET", "/profiles")
+async def profiles_endpoint(request: Request) -> Response:
+    try:
+        locale = Locale(request.query.get("locale", "en").lower())
+    except ValueError:
+        return Response(b"Unknown locale", 400)
+    try:
+        count = int(request.query.get("count", "100"))
+    except ValueError:
+        return Response(b"count must be an integer", 400)
+    if not 0 < count <= PROFILE_API_MAX_COUNT:
+        return Response(f"count must be between 1 and {PROFILE_API_MAX_COUNT}".encode(), 400)
+    file_format = request.query.get("format", "ndjson").lower()
+    if file_format not in API_FORMATS:
+        return Response(f"format must be one of {', '.join(API_FORMATS)}".encode(), 400)
+    try:
+        fields = compile_template(request.query["fields"]) if "fields" in request.query else ""
+    except ValueError as e:
+        return Response(str(e).encode(), 400)
+    unique = request.query.get("unique")
+    if unique not in (None, "export", "global"):
+        return Response(b"unique must be export or global", 400)
+
+    peer = request.peer
+    if _client_streams.get(peer, 0) >= PROFILE_API_CLIENT_CONCURRENCY:
+        return Response(b"Too many concurrent streams", 429)
+    _client_streams[peer] = _client_streams.get(peer, 0) + 1
+    bloom = None
+
+    def release():
+        _client_streams[peer] -= 1
+        if not _client_streams[peer]:
+            del _client_streams[peer]
+        if bloom is not None:
+            unique_filters.release(bloom)
+
+    if unique:
+        try:
+            bloom = await unique_filters.get(unique, count)
+        except Exception as e:
+            release()
+            logger.error(f"Error opening {unique} uniqueness filter for {peer}: {e}")
+            return Response(b"Uniqueness filter unavailable", 500)
+
+    logger.info(f"Streaming {count} {locale.value} profiles as {file_format} to {peer}")
+    return StreamingResponse(
+        stream_profiles(locale, count, fields, file_format, bloom),
+        content_type=API_FORMATS[file_format],
+        on_close=release,
+    )
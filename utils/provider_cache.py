@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+
+from mimesis import Generic
+from mimesis.enums import Locale
+from mimesis.providers.finance import Finance
+
+from config.settings import PROVIDER_CACHE_SIZE
+
+
+class ProviderRegistry:
+    # LRU of (Generic, Finance) pairs keyed by Locale. Building a provider makes
+    # mimesis read and parse the locale's JSON datasets, so we only want to pay
+    # that once per locale instead of once per generated profile.
+
+    def __init__(self, max_size: int = PROVIDER_CACHE_SIZE):
+        self.max_size = max(1, max_size)
+        self._providers: "OrderedDict[Locale, Tuple[Generic, Finance]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, locale: Locale) -> Tuple[Generic, Finance]:
+        with self._lock:
+            providers = self._providers.get(locale)
+            if providers is not None:
+                self._providers.move_to_end(locale)
+                self.hits += 1
+                return providers
+            self.misses += 1
+
+        # Build outside the lock so a cold locale does not block lookups of
+        # the warm ones. Two handlers racing on the same cold locale both build,
+        # and the first one stored wins.
+        providers = self._build(locale)
+
+        with self._lock:
+            existing = self._providers.get(locale)
+            if existing is not None:
+                self._providers.move_to_end(locale)
+                return existing
+            self._providers[locale] = providers
+            while len(self._providers) > self.max_size:
+                self._providers.popitem(last=False)
+                self.evictions += 1
+        return providers
+
+    def warm(self, locales: Iterable[Locale]):
+        for locale in locales:
+            self.get(locale)
+
+    def clear(self):
+        with self._lock:
+            self._providers.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._providers),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    @staticmethod
+    def _build(locale: Locale) -> Tuple[Generic, Finance]:
+        generic = Generic(locale)
+        # Generic creates its data providers lazily on first attribute access,
+        # so touch the ones build_details uses to load their datasets now.
+        generic.person
+        generic.address
+        generic.datetime
+        return generic, Finance(locale)
+
+
+provider_registry = ProviderRegistry()
+
+# Generation workers get a registry of their own so that no two threads ever
+# draw from the same provider's random state.
+_worker = threading.local()
+
+
+def init_worker_registry(locales: Iterable[Locale] = ()):
+    _worker.registry = ProviderRegistry()
+    _worker.registry.warm(locales)
+
+
+def current_registry() -> ProviderRegistry:
+    return getattr(_worker, "registry", provider_registry)
@@ -0,0 +1,190 @@
+import html
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import observe_stage
+
+MESSAGE_LIMIT = 4096
+
+FIELD_ICONS = {
+    "Full Name": "👤",
+    "Age": "🎂",
+    "Birth Date": "📅",
+    "Sex": "⚧️",
+    "University": "🏛️",
+    "Street Name": "🏠",
+    "City": "🏙️",
+    "State": "🇺🇸",
+    "Country": "🌎",
+    "Postal Code": "📮",
+    "Company": "🏢",
+    "Phone Number": "📞",
+    "Occupation": "💼",
+    "Nationality": "🌍",
+    "Language": "🗣️",
+    "Username": "🖥️",
+    "Password": "🔐",
+    "Weight": "⚖️",
+    "Height": "📏",
+}
+
+
+def escape_markdown(text: str) -> str:
+    for char in "\\`*_[]<>#":
+        text = text.replace(char, "\\" + char)
+    return text
+
+
+def escape_text(text: str) -> str:
+    return text
+
+
+class ProfileTemplate:
+    # A line template such as "{icon} <b>{key}:</b> <code>{value}</code>" is
+    # split around {value} once per field name, so rendering a profile is one
+    # dict lookup and one concatenation per field followed by a single join.
+
+    def __init__(
+        self,
+        title: str,
+        line: str,
+        escape: Callable[[str], str],
+        footer: str = "",
+    ):
+        self.title = title
+        self.line = line
+        self.escape = escape
+        self.footer = footer
+        self._lines: Dict[str, Tuple[str, str]] = {}
+        for key in FIELD_ICONS:
+            self._compile(key)
+
+    def _compile(self, key: str) -> Tuple[str, str]:
+        icon = FIELD_ICONS.get(key, "")
+        prefix, suffix = self.line.format(
+            icon=icon, key=self.escape(key), value="\0"
+        ).split("\0")
+        if not icon:
+            prefix = prefix.lstrip()
+        self._lines[key] = prefix, suffix
+        return prefix, suffix
+
+    def render(self, details: Dict[str, Any], title: Optional[str] = None) -> str:
+        escape = self.escape
+        lines = self._lines
+        parts = [self.title.format(title=escape(title or profile_title(details)))]
+        for key, value in details.items():
+            prefix, suffix = lines.get(key) or self._compile(key)
+            parts.append(prefix + escape(str(value)) + suffix)
+        parts.append(self.footer)
+        return "".join(parts)
+
+
+def profile_title(details: Dict[str, Any]) -> str:
+    return f"Personal Profile: {details.get('Full Name', '')}"
+
+
+def escape_vcard(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace(",", "\\,")
+        .replace(";", "\\;")
+        .replace("\n", "\\n")
+    )
+
+
+def render_vcard(details: Dict[str, Any], title: Optional[str] = None) -> str:
+    def get(key: str) -> str:
+        return escape_vcard(str(details.get(key, "")))
+
+    street = " ".join(
+        part for part in (get("Street Number"), get("Street Name")) if part
+    )
+    lines = [
+        "BEGIN:VCARD",
+        "VERSION:3.0",
+        f"FN:{get('Full Name')}",
+        f"N:{get('Last Name')};{get('First Name')};;;",
+        f"BDAY:{get('Birth Date')}",
+        f"TEL;TYPE=CELL:{get('Phone Number')}",
+        f"ADR;TYPE=HOME:;;{street};{get('City')};{get('State')};"
+        f"{get('Postal Code')};{get('Country')}",
+        f"ORG:{get('Company')}",
+        f"TITLE:{get('Occupation')}",
+        "END:VCARD",
+    ]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def render_json(details: Dict[str, Any], title: Optional[str] = None) -> str:
+    return json.dumps(details, ensure_ascii=False)
+
+
+TEMPLATES = {
+    "telegram": ProfileTemplate(
+        "<b>{title}</b>\n\n",
+        "{icon} <b>{key}:</b> <code>{value}</code>\n",
+        lambda text: html.escape(text, quote=False),
+    ),
+    "html": ProfileTemplate(
+        "<h3>{title}</h3>",
+        "<p>{icon} <b>{key}:</b> {value}</p>",
+        html.escape,
+        footer="<hr>",
+    ),
+    "markdown": ProfileTemplate(
+        "**{title}**\n\n",
+        "{icon} **{key}:** {value}\n",
+        escape_markdown,
+    ),
+    "text": ProfileTemplate(
+        "{title}\n\n",
+        "{icon} {key}: {value}\n",
+        escape_text,
+    ),
+}
+
+RENDERERS = {name: template.render for name, template in TEMPLATES.items()}
+RENDERERS["json"] = render_json
+RENDERERS["vcard"] = render_vcard
+
+RENDER_FORMATS = tuple(RENDERERS)
+
+
+def render_profile(
+    details: Dict[str, Any], output_format: str = "telegram", title: Optional[str] = None
+) -> str:
+    started = time.perf_counter()
+    rendered = RENDERERS[output_format](details, title)
+    observe_stage("render", time.perf_counter() - started)
+    return rendered
+
+
+def message_length(text: str) -> int:
+    # Telegram measures message length in UTF-16 code units
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    # Splits on line boundaries so no HTML tag or entity is cut in half; only a
+    # single line longer than the limit is cut mid-line.
+    if message_length(text) <= limit:
+        return [text]
+    chunks = []
+    current: List[str] = []
+    length = 0
+    for line in text.splitlines(keepends=True):
+        size = message_length(line)
+        if current and length + size > limit:
+            chunks.append("".join(current))
+            current, length = [], 0
+        while size > limit:
+            chunks.append(line[: limit // 2])
+            line = line[limit // 2 :]
+            size = message_length(line)
+        current.append(line)
+        length += size
+    if current:
+        chunks.append("".join(current))
+    return chunks
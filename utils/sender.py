@@ -0,0 +1,289 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from pyrogram.errors import FloodWait
+from pyrogram.types import Message
+
+from config.settings import (
+    SEND_CHAT_BURST,
+    SEND_CHAT_RATE,
+    SEND_CONCURRENCY,
+    SEND_GLOBAL_RATE,
+    SEND_MAX_RETRIES,
+)
+from logs.logger import logger
+from utils.metrics import current_command, observe_stage
+
+# Priority classes, lowest value goes first
+INTERACTIVE = 0
+BULK = 1
+DOCUMENT = 2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class SendJob:
+    __slots__ = (
+        "priority", "seq", "chat_id", "factory", "future", "coalesce_key", "attempts", "command"
+    )
+
+    def __init__(self, priority, seq, chat_id, factory, future, coalesce_key):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.factory = factory
+        self.future = future
+        self.coalesce_key = coalesce_key
+        self.attempts = 0
+        # Sends run on the dispatcher's tasks; keep the command that queued them
+        self.command = current_command.get()
+
+
+class ChatQueue:
+    __slots__ = ("jobs", "bucket", "ready_at")
+
+    def __init__(self):
+        self.jobs: List[Tuple[int, int, SendJob]] = []
+        self.bucket = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+        self.ready_at = 0.0
+
+
+class OutboundScheduler:
+    # Every outgoing Telegram call is queued here and dispatched under a
+    # global token bucket and one bucket per chat. Chats whose next job may
+    # run now sit in a heap ordered by that job's priority, so interactive
+    # replies overtake bulk progress edits and document uploads. A FloodWait
+    # pauses only the chat it was raised for, and the job is retried after
+    # the wait. A queued edit of a message is replaced by a newer edit of the
+    # same message instead of being sent twice.
+
+    def __init__(self):
+        self._chats: Dict[int, ChatQueue] = {}
+        self._ready: List[Tuple[int, int, int]] = []
+        self._waiting: List[Tuple[float, int]] = []
+        self._coalesced: Dict[Hashable, SendJob] = {}
+        self._global = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_RATE)
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight = set()
+        self._pruned = 0.0
+        self.sent = 0
+        self.flood_waits = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(SEND_CONCURRENCY)
+            self._task = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self, timeout: float = 10.0):
+        if self._task is None:
+            return
+        # Give queued sends a chance to go out before shutting down
+        deadline = time.monotonic() + timeout
+        while (self.queue_depth() or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def queue_depth(self) -> int:
+        return sum(len(chat.jobs) for chat in self._chats.values())
+
+    async def submit(
+        self,
+        chat_id: int,
+        factory: Callable[[], Awaitable[Any]],
+        priority: int = INTERACTIVE,
+        coalesce_key: Optional[Hashable] = None,
+    ) -> Any:
+        if self._task is None:
+            return await factory()
+
+        if coalesce_key is not None:
+            queued = self._coalesced.get(coalesce_key)
+            if queued is not None:
+                # Not sent yet: send the newest content in its place
+                queued.factory = factory
+                self.coalesced += 1
+                return await asyncio.shield(queued.future)
+
+        job = SendJob(
+            priority,
+            next(self._seq),
+            chat_id,
+            factory,
+            asyncio.get_running_loop().create_future(),
+            coalesce_key,
+        )
+        if coalesce_key is not None:
+            self._coalesced[coalesce_key] = job
+        self._enqueue(job)
+        return await asyncio.shield(job.future)
+
+    def _enqueue(self, job: SendJob):
+        chat = self._chats.get(job.chat_id)
+        if chat is None:
+            chat = self._chats[job.chat_id] = ChatQueue()
+        heapq.heappush(chat.jobs, (job.priority, job.seq, job))
+        self._schedule(job.chat_id, chat)
+        self._wakeup.set()
+
+    def _schedule(self, chat_id: int, chat: ChatQueue):
+        if not chat.jobs:
+            return
+        if chat.ready_at <= time.monotonic():
+            priority, seq, _ = chat.jobs[0]
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+        else:
+            heapq.heappush(self._waiting, (chat.ready_at, chat_id))
+
+    def _next_job(self, now: float) -> Optional[SendJob]:
+        while self._waiting and self._waiting[0][0] <= now:
+            _, chat_id = heapq.heappop(self._waiting)
+            chat = self._chats.get(chat_id)
+            if chat is not None and chat.ready_at <= now:
+                self._schedule(chat_id, chat)
+        while self._ready:
+            priority, seq, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            # Entries go stale when the chat's head job changed or it was
+            # paused after the entry was pushed
+            if chat is None or not chat.jobs or chat.jobs[0][:2] != (priority, seq):
+                continue
+            if chat.ready_at > now:
+                heapq.heappush(self._waiting, (chat.ready_at, chat_id))
+                continue
+            _, _, job = heapq.heappop(chat.jobs)
+            chat.bucket.take(now)
+            chat.ready_at = now + chat.bucket.delay(now)
+            self._schedule(chat_id, chat)
+            return job
+        return None
+
+    def _prune(self, now: float):
+        # Forget chats that have nothing queued and a full bucket again; they
+        # would start over in exactly that state.
+        if now - self._pruned < 10:
+            return
+        self._pruned = now
+        for chat_id in [
+            chat_id
+            for chat_id, chat in self._chats.items()
+            if not chat.jobs and chat.bucket.delay(now) == 0
+            and chat.bucket.tokens >= chat.bucket.capacity
+        ]:
+            del self._chats[chat_id]
+
+    async def _dispatch_loop(self):
+        while True:
+            now = time.monotonic()
+            delay = self._global.delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            job = self._next_job(now)
+            if job is None:
+                self._prune(now)
+                self._wakeup.clear()
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._global.take(now)
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, job: SendJob):
+        try:
+            if job.coalesce_key is not None and self._coalesced.get(job.coalesce_key) is job:
+                del self._coalesced[job.coalesce_key]
+            job.attempts += 1
+            started = time.perf_counter()
+            result = await job.factory()
+            observe_stage("send", time.perf_counter() - started, job.command)
+        except FloodWait as e:
+            self.flood_waits += 1
+            if job.attempts > SEND_MAX_RETRIES:
+                self.failed += 1
+                job.future.set_exception(e)
+                return
+            logger.info(f"FloodWait of {e.value}s for chat {job.chat_id}, retrying")
+            chat = self._chats.get(job.chat_id)
+            if chat is None:
+                chat = self._chats[job.chat_id] = ChatQueue()
+            chat.ready_at = max(chat.ready_at, time.monotonic() + e.value)
+            if job.coalesce_key is not None:
+                self._coalesced.setdefault(job.coalesce_key, job)
+            self._enqueue(job)
+        except Exception as e:
+            self.failed += 1
+            job.future.set_exception(e)
+        else:
+            self.sent += 1
+            job.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self.queue_depth(),
+            "in_flight": len(self._inflight),
+            "sent": self.sent,
+            "flood_waits": self.flood_waits,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+        }
+
+
+sender = OutboundScheduler()
+
+
+async def reply_text(message: Message, text: str, priority: int = INTERACTIVE, **kwargs):
+    return await sender.submit(
+        message.chat.id, lambda: message.reply_text(text, **kwargs), priority
+    )
+
+
+async def edit_text(message: Message, text: str, priority: int = INTERACTIVE, **kwargs):
+    return await sender.submit(
+        message.chat.id,
+        lambda: message.edit_text(text, **kwargs),
+        priority,
+        coalesce_key=(message.chat.id, message.id),
+    )
+
+
+async def reply_document(message: Message, document, priority: int = DOCUMENT, **kwargs):
+    return await sender.submit(
+        message.chat.id, lambda: message.reply_document(document, **kwargs), priority
+    )
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from config.settings import (
+    SESSION_BACKEND,
+    SESSION_CACHE_SIZE,
+    SESSION_CACHE_TTL,
+    SESSION_RETENTION,
+    SESSION_SQLITE_PATH,
+)
+
+
+# Per-user settings kept by the store, as backend field names
+SESSION_FIELDS = ("locale", "template")
+
+
+class Session:
+    __slots__ = ("locale", "template", "expires")
+
+    def __init__(self, locale: Optional[str], template: Optional[str], expires: float):
+        self.locale = locale
+        self.template = template
+        self.expires = expires
+
+
+class MongoSessionBackend:
+    def __init__(self):
+        from utils.storage import mongo_database
+
+        self.collection = mongo_database()["sessions"]
+
+    async def open(self):
+        # Mongo drops sessions nobody has touched for SESSION_RETENTION seconds
+        await self.collection.create_index(
+            "updated", expireAfterSeconds=SESSION_RETENTION, name="session_expiry"
+        )
+
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": user_id}, {"_id": 0, "updated": 0})
+
+    async def save(self, user_id: int, fields: Dict[str, Any]):
+        await self.collection.update_one(
+            {"_id": user_id},
+            {"$set": {**fields, "updated": datetime.utcnow()}},
+            upsert=True,
+        )
+
+
+class SQLiteSessionBackend:
+    # Local stand-in for single-node deployments. Calls run on a worker
+    # thread so the event loop never waits on the disk.
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(user_id INTEGER PRIMARY KEY, locale TEXT, template TEXT, updated REAL)"
+        )
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(sessions)")}
+        if "template" not in columns:
+            connection.execute("ALTER TABLE sessions ADD COLUMN template TEXT")
+        connection.execute(
+            "DELETE FROM sessions WHERE updated < ?", (time.time() - SESSION_RETENTION,)
+        )
+        connection.commit()
+        self._connection = connection
+
+    async def open(self):
+        await asyncio.to_thread(self._open)
+
+    def _load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT locale, template FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return dict(zip(SESSION_FIELDS, row)) if row else None
+
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._load, user_id)
+
+    def _save(self, user_id: int, fields: Dict[str, Any]):
+        # Only the given fields are overwritten, like Mongo's $set
+        names = [name for name in SESSION_FIELDS if name in fields] + ["updated"]
+        updates = ", ".join(f"{name} = excluded.{name}" for name in names)
+        with self._lock:
+            self._connection.execute(
+                f"INSERT INTO sessions (user_id, {', '.join(names)}) "
+                f"VALUES (?{', ?' * len(names)}) "
+                f"ON CONFLICT(user_id) DO UPDATE SET {updates}",
+                (user_id, *(fields[name] for name in names[:-1]), time.time()),
+            )
+            self._connection.commit()
+
+    async def save(self, user_id: int, fields: Dict[str, Any]):
+        await asyncio.to_thread(self._save, user_id, fields)
+
+
+SESSION_BACKENDS = {
+    "mongo": MongoSessionBackend,
+    "sqlite": SQLiteSessionBackend,
+}
+
+
+class SessionStore:
+    # A bounded LRU of recently active users in front of a persistent backend
+    # shared by every bot process. Entries expire from the LRU after
+    # SESSION_CACHE_TTL seconds, which also bounds how long a change made by
+    # another process can go unnoticed here.
+
+    def __init__(
+        self,
+        backend_name: str = SESSION_BACKEND,
+        max_size: int = SESSION_CACHE_SIZE,
+        ttl: float = SESSION_CACHE_TTL,
+    ):
+        self.backend_name = backend_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._backend = None
+        self._cache: "OrderedDict[int, Session]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = SESSION_BACKENDS[self.backend_name]()
+        return self._backend
+
+    async def open(self):
+        await self.backend.open()
+
+    def _cached(self, user_id: int) -> Optional[Session]:
+        session = self._cache.get(user_id)
+        if session is None:
+            return None
+        if session.expires < time.monotonic():
+            del self._cache[user_id]
+            return None
+        self._cache.move_to_end(user_id)
+        return session
+
+    def _remember(self, user_id: int, session: Session):
+        self._cache[user_id] = session
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, user_id: int) -> Optional[Session]:
+        session = self._cached(user_id)
+        if session is not None:
+            self.hits += 1
+            return session
+        self.misses += 1
+        fields = await self.backend.load(user_id)
+        if fields is None:
+            return None
+        session = Session(
+            fields.get("locale"), fields.get("template"), time.monotonic() + self.ttl
+        )
+        self._remember(user_id, session)
+        return session
+
+    async def get_locale(self, user_id: int) -> Optional[str]:
+        session = await self.get(user_id)
+        return session.locale if session else None
+
+    async def get_template(self, user_id: int) -> str:
+        session = await self.get(user_id)
+        return (session.template or "") if session else ""
+
+    async def _update(self, user_id: int, **fields: Any):
+        # Loads the session first so fields this call does not touch stay
+        # cached alongside the new ones
+        session = await self.get(user_id) or Session(None, None, 0.0)
+        for name, value in fields.items():
+            setattr(session, name, value)
+        session.expires = time.monotonic() + self.ttl
+        self._remember(user_id, session)
+        await self.backend.save(user_id, fields)
+
+    async def set_locale(self, user_id: int, locale: str):
+        await self._update(user_id, locale=locale)
+
+    async def set_template(self, user_id: int, template: str):
+        # "" selects every field
+        await self._update(user_id, template=template)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+session_store = SessionStore()
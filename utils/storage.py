@@ -0,0 +1,310 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from config.settings import (
+    DB_NAME,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_URI,
+    MONGO_WRITE_CONCERN,
+    STORAGE_SQLITE_PATH,
+)
+
+# (timestamp, id) of a history entry; the id is the backend's own
+# (an ObjectId in Mongo, a rowid in SQLite), passed around as a string
+HistoryKey = Tuple[datetime, str]
+
+# The stored fields of a history entry besides user_id/username; "details"
+# only exists on entries written before profiles were stored by seed
+HISTORY_FIELDS = ("timestamp", "details", "l", "s", "v", "y", "f")
+
+
+class PartialWriteError(Exception):
+    # Raised by insert_many when some documents were written and others
+    # were rejected; retrying would duplicate the ones that succeeded
+    def __init__(self, inserted: int, errors: List[Any]):
+        super().__init__(f"{inserted} inserted, first error: {errors[:1]}")
+        self.inserted = inserted
+        self.errors = errors
+
+
+_mongo_client = None
+
+
+def mongo_database():
+    # One pooled client per process, created on first use so importing the
+    # bot does not require Mongo to be configured
+    global _mongo_client
+    if _mongo_client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        write_concern = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+        _mongo_client = AsyncIOMotorClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            w=write_concern,
+        )
+    return _mongo_client[DB_NAME]
+
+
+class MongoStorage:
+    def __init__(self, collection_name: str = "users"):
+        self.collection_name = collection_name
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = mongo_database()[self.collection_name]
+        return self._collection
+
+    async def open(self):
+        from pymongo import ASCENDING, DESCENDING
+
+        # Serves history lookups for one user, newest first, as an index scan
+        # with no in-memory sort; _id breaks ties between equal timestamps.
+        await self.collection.create_index(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="user_history",
+        )
+
+    async def close(self):
+        pass
+
+    async def insert(self, document: Dict[str, Any]):
+        await self.collection.insert_one(document)
+
+    async def insert_many(self, documents: List[Dict[str, Any]]):
+        from pymongo.errors import BulkWriteError
+
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            raise PartialWriteError(
+                e.details.get("nInserted", 0), e.details.get("writeErrors", [])
+            ) from e
+
+    async def history_page(
+        self,
+        user_id: int,
+        limit: int,
+        before: Optional[HistoryKey] = None,
+        after: Optional[HistoryKey] = None,
+    ) -> List[Dict[str, Any]]:
+        from bson import ObjectId
+
+        query: Dict[str, Any] = {"user_id": user_id}
+        order = -1
+        if before is not None or after is not None:
+            timestamp, entry_id = before or after
+            op = "$lt" if before is not None else "$gt"
+            order = -1 if before is not None else 1
+            query["$or"] = [
+                {"timestamp": {op: timestamp}},
+                {"timestamp": timestamp, "_id": {op: ObjectId(entry_id)}},
+            ]
+        cursor = (
+            self.collection.find(query, dict.fromkeys(HISTORY_FIELDS, 1))
+            .sort([("timestamp", order), ("_id", order)])
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
+
+    async def export_batches(
+        self,
+        user_id: int,
+        since: Optional[datetime],
+        until: Optional[datetime],
+        batch_size: int,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        query: Dict[str, Any] = {"user_id": user_id}
+        if since is not None or until is not None:
+            query["timestamp"] = {}
+            if since is not None:
+                query["timestamp"]["$gte"] = since
+            if until is not None:
+                query["timestamp"]["$lt"] = until
+        cursor = (
+            self.collection.find(query, dict.fromkeys(HISTORY_FIELDS, 1))
+            .sort([("timestamp", -1), ("_id", -1)])
+            .batch_size(batch_size)
+        )
+        batch = []
+        async for entry in cursor:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class SQLiteStorage:
+    # Embedded storage for single-node and offline deployments. One
+    # connection in WAL mode is used from worker threads under a lock;
+    # insert_many writes its whole batch in one transaction, which is what
+    # makes the write-behind buffer's batches cheap here. Timestamps are kept
+    # to the millisecond, like Mongo's, so history keys compare the same way.
+
+    def __init__(self, path: str = STORAGE_SQLITE_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._connection is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "username TEXT, timestamp TEXT NOT NULL, l TEXT, s INTEGER, v INTEGER, y INTEGER, "
+            "f TEXT, details TEXT)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS user_history ON history (user_id, timestamp DESC, id DESC)"
+        )
+        self._connection = connection
+
+    async def open(self):
+        await asyncio.to_thread(self._open)
+
+    async def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await asyncio.to_thread(connection.close)
+
+    def _execute(self, sql: str, parameters=()) -> List[tuple]:
+        with self._lock:
+            self._open()
+            return self._connection.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def _row(document: Dict[str, Any]) -> tuple:
+        timestamp = document["timestamp"]
+        timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+        details = document.get("details")
+        return (
+            document["user_id"],
+            document.get("username"),
+            timestamp.isoformat(" ", "microseconds"),
+            document.get("l"),
+            document.get("s"),
+            document.get("v"),
+            document.get("y"),
+            document.get("f"),
+            json.dumps(details, ensure_ascii=False) if details is not None else None,
+        )
+
+    @staticmethod
+    def _entry(row: tuple) -> Dict[str, Any]:
+        entry_id, timestamp, l, s, v, y, f, details = row
+        entry = {"_id": entry_id, "timestamp": datetime.fromisoformat(timestamp)}
+        if details is not None:
+            entry["details"] = json.loads(details)
+        else:
+            entry.update(l=l, s=s, v=v, y=y)
+            if f:
+                entry["f"] = f
+        return entry
+
+    def _insert_many(self, rows: List[tuple]):
+        with self._lock:
+            self._open()
+            connection = self._connection
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(
+                    "INSERT INTO history (user_id, username, timestamp, l, s, v, y, f, details) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    async def insert(self, document: Dict[str, Any]):
+        await asyncio.to_thread(self._insert_many, [self._row(document)])
+
+    async def insert_many(self, documents: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._insert_many, [self._row(document) for document in documents])
+
+    async def history_page(
+        self,
+        user_id: int,
+        limit: int,
+        before: Optional[HistoryKey] = None,
+        after: Optional[HistoryKey] = None,
+    ) -> List[Dict[str, Any]]:
+        where, parameters, order = "user_id = ?", [user_id], "DESC"
+        if before is not None or after is not None:
+            timestamp, entry_id = before or after
+            op = "<" if before is not None else ">"
+            order = "DESC" if before is not None else "ASC"
+            timestamp = timestamp.isoformat(" ", "microseconds")
+            where += f" AND (timestamp {op} ? OR (timestamp = ? AND id {op} ?))"
+            parameters += [timestamp, timestamp, int(entry_id)]
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT id, timestamp, l, s, v, y, f, details FROM history "
+            f"WHERE {where} ORDER BY timestamp {order}, id {order} LIMIT ?",
+            (*parameters, limit),
+        )
+        return [self._entry(row) for row in rows]
+
+    async def export_batches(
+        self,
+        user_id: int,
+        since: Optional[datetime],
+        until: Optional[datetime],
+        batch_size: int,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        # Walks the index a batch at a time by keyset, so the lock is never
+        # held while the caller writes a batch out
+        key: Optional[HistoryKey] = None
+        while True:
+            where, parameters = "user_id = ?", [user_id]
+            if since is not None:
+                where += " AND timestamp >= ?"
+                parameters.append(since.isoformat(" ", "microseconds"))
+            if until is not None:
+                where += " AND timestamp < ?"
+                parameters.append(until.isoformat(" ", "microseconds"))
+            if key is not None:
+                timestamp = key[0].isoformat(" ", "microseconds")
+                where += " AND (timestamp < ? OR (timestamp = ? AND id < ?))"
+                parameters += [timestamp, timestamp, key[1]]
+            rows = await asyncio.to_thread(
+                self._execute,
+                "SELECT id, timestamp, l, s, v, y, f, details FROM history "
+                f"WHERE {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (*parameters, batch_size),
+            )
+            if not rows:
+                return
+            batch = [self._entry(row) for row in rows]
+            yield batch
+            if len(rows) < batch_size:
+                return
+            key = (batch[-1]["timestamp"], batch[-1]["_id"])
+
+
+STORAGE_BACKENDS = {
+    "mongo": MongoStorage,
+    "sqlite": SQLiteStorage,
+}
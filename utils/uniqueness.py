@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import math
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from mimesis.enums import Locale
+
+from config.settings import (
+    UNIQUE_CACHE_SIZE,
+    UNIQUE_DIR,
+    UNIQUE_ERROR_RATE,
+    UNIQUE_GLOBAL_CAPACITY,
+    UNIQUE_MAX_ATTEMPTS,
+    UNIQUE_USER_CAPACITY,
+)
+from logs.logger import logger
+from utils.details_generator import refresh_fields
+from utils.engine import generation_engine
+
+# Fields a bulk consumer is likely to put a unique constraint on
+UNIQUE_FIELDS = ("Username", "Phone Number")
+UNIQUE_SCOPES = ("export", "user", "global")
+
+# magic, hash count, bit count, capacity, values added, false-positive rate
+FILTER_HEADER = struct.Struct("<4sIQQQd")
+FILTER_MAGIC = b"BLM1"
+
+# Filters are filled and saved on worker threads; one lock keeps a batch of
+# claims and a save of the same bits from interleaving
+_filter_lock = threading.Lock()
+
+
+class UniquenessError(Exception):
+    pass
+
+
+class BloomFilter:
+    # A fixed-size bit array with k hash positions per value, derived from
+    # one blake2b digest by double hashing. It never forgets a value, so a
+    # value it has not seen is always accepted; a value it reports as seen
+    # may be new with probability error_rate while count stays within
+    # capacity, in which case we only regenerate a field needlessly.
+
+    def __init__(self, capacity: int, error_rate: float = UNIQUE_ERROR_RATE):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.dirty = False
+
+    def _positions(self, value: str) -> Iterator[int]:
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        position = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        for _ in range(self.hashes):
+            yield position % size
+            position += step
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[index >> 3] & (1 << (index & 7)) for index in self._positions(value))
+
+    def add(self, value: str) -> bool:
+        # True if the value was new and is now recorded
+        bits = self.bits
+        added = False
+        for index in self._positions(value):
+            mask = 1 << (index & 7)
+            if not bits[index >> 3] & mask:
+                bits[index >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+            self.dirty = True
+            if self.count == self.capacity + 1:
+                logger.warning(
+                    f"Uniqueness filter past its capacity of {self.capacity}; "
+                    "collision checks will regenerate more values than needed"
+                )
+        return added
+
+    def save(self, path: str):
+        # Snapshot under the lock, write without it
+        with _filter_lock:
+            header = FILTER_HEADER.pack(
+                FILTER_MAGIC, self.hashes, self.size, self.capacity, self.count, self.error_rate
+            )
+            bits = bytes(self.bits)
+            self.dirty = False
+        temporary = path + ".tmp"
+        try:
+            with open(temporary, "wb") as file:
+                file.write(header)
+                file.write(bits)
+            os.replace(temporary, path)
+        except BaseException:
+            self.dirty = True
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        with open(path, "rb") as file:
+            magic, hashes, size, capacity, count, error_rate = FILTER_HEADER.unpack(
+                file.read(FILTER_HEADER.size)
+            )
+            if magic != FILTER_MAGIC:
+                raise ValueError(f"{path} is not a uniqueness filter")
+            bloom = cls.__new__(cls)
+            bloom.capacity = capacity
+            bloom.error_rate = error_rate
+            bloom.size = size
+            bloom.hashes = hashes
+            bloom.bits = bytearray(file.read())
+            bloom.count = count
+            bloom.dirty = False
+        return bloom
+
+
+class FilterStore:
+    # Persistent filters for the "user" and "global" scopes, one file each
+    # under directory. At most cache_size are held in memory; the least
+    # recently used is written back when another has to be loaded, and
+    # close() writes back the rest. "export" filters live for one job only.
+    # get() pins a filter until the matching release(), so a running job's
+    # filter is never evicted and reloaded without its newer values.
+
+    def __init__(self, directory: str = UNIQUE_DIR, cache_size: int = UNIQUE_CACHE_SIZE):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._filters: "OrderedDict[str, BloomFilter]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bloom")
+
+    def _open(self, key: str, capacity: int) -> BloomFilter:
+        path = self._path(key)
+        if os.path.exists(path):
+            return BloomFilter.load(path)
+        os.makedirs(self.directory, exist_ok=True)
+        return BloomFilter(capacity)
+
+    async def get(self, scope: str, count: int, user_id: Optional[int] = None) -> BloomFilter:
+        if scope == "export":
+            return BloomFilter(count * len(UNIQUE_FIELDS))
+        if scope == "user":
+            key, capacity = f"user_{user_id}", UNIQUE_USER_CAPACITY
+        else:
+            key, capacity = "global", UNIQUE_GLOBAL_CAPACITY
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            bloom = self._filters.get(key)
+            if bloom is None:
+                bloom = await asyncio.to_thread(self._open, key, capacity)
+                self._filters[key] = bloom
+            self._filters.move_to_end(key)
+            self._pins[key] = self._pins.get(key, 0) + 1
+            while len(self._filters) > self.cache_size:
+                evicted_key = next((cached for cached in self._filters if cached not in self._pins), None)
+                if evicted_key is None:
+                    # Every cached filter is in use; shrink once they are released
+                    break
+                evicted = self._filters.pop(evicted_key)
+                if evicted.dirty:
+                    await asyncio.to_thread(evicted.save, self._path(evicted_key))
+        return bloom
+
+    def release(self, bloom: BloomFilter):
+        for key, cached in self._filters.items():
+            if cached is bloom:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+                return
+
+    async def flush(self):
+        for key, bloom in list(self._filters.items()):
+            if bloom.dirty:
+                await asyncio.to_thread(bloom.save, self._path(key))
+
+    async def close(self):
+        await self.flush()
+        self._filters.clear()
+        self._pins.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {key: bloom.count for key, bloom in self._filters.items()}
+
+
+def claim_values(bloom: BloomFilter, values: List[Tuple[str, int, Any]]) -> List[Tuple[str, int]]:
+    # Records each (field, row, value) in the filter and returns the
+    # (field, row) positions whose value was already there
+    with _filter_lock:
+        return [(field, row) for field, row, value in values if not bloom.add(f"{field}\0{value}")]
+
+
+async def ensure_unique(locale: Locale, columns: Dict[str, List], bloom: BloomFilter) -> int:
+    # Claims every unique field value of a column batch in the filter and
+    # redraws just the fields that collide, keeping the rest of the profile.
+    # Hashing runs on a thread and redraws on the generation workers, whose
+    # providers are warm, so neither holds up the event loop. Returns how
+    # many values were redrawn.
+    collided = await asyncio.to_thread(
+        claim_values,
+        bloom,
+        [
+            (field, row, value)
+            for field in UNIQUE_FIELDS
+            if field in columns
+            for row, value in enumerate(columns[field])
+        ],
+    )
+    redrawn = 0
+    attempt = 0
+    while collided:
+        attempt += 1
+        if attempt > UNIQUE_MAX_ATTEMPTS:
+            raise UniquenessError(
+                f"No unique {collided[0][0]} after {UNIQUE_MAX_ATTEMPTS} attempts"
+            )
+        requests = [
+            ({key: column[row] for key, column in columns.items()}, field)
+            for field, row in collided
+        ]
+        values = await generation_engine.run(refresh_fields, locale, requests, attempt)
+        for (field, row), value in zip(collided, values):
+            columns[field][row] = value
+        redrawn += len(values)
+        collided = await asyncio.to_thread(
+            claim_values, bloom, [(field, row, columns[field][row]) for field, row in collided]
+        )
+    return redrawn
+
+
+unique_filters = FilterStore()
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from config.settings import (
+    WRITE_BATCH_SIZE,
+    WRITE_BUFFER_SIZE,
+    WRITE_FLUSH_INTERVAL,
+    WRITE_MAX_RETRIES,
+    WRITE_OVERFLOW_POLICY,
+    WRITE_RETRY_BACKOFF,
+)
+from logs.logger import logger
+from utils.metrics import observe_stage
+from utils.storage import PartialWriteError
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class WriteBehindBuffer:
+    # Documents are queued by handlers and written by a single flusher task in
+    # unordered insert_many batches to a utils.storage backend, once WRITE_BATCH_SIZE documents are
+    # waiting or WRITE_FLUSH_INTERVAL seconds have passed since the first one.
+    # The queue is bounded; when it is full, WRITE_OVERFLOW_POLICY decides
+    # whether the oldest or the newest document is dropped or the caller waits.
+
+    def __init__(
+        self,
+        storage,
+        max_size: int = WRITE_BUFFER_SIZE,
+        batch_size: int = WRITE_BATCH_SIZE,
+        flush_interval: float = WRITE_FLUSH_INTERVAL,
+        overflow_policy: str = WRITE_OVERFLOW_POLICY,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.storage = storage
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._inflight: Optional[asyncio.Future] = None
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # Whatever is in flight, half-collected or still queued is written
+        # before shutdown completes
+        if self._inflight is not None:
+            await self._inflight
+        batch, self._batch = self._batch, []
+        await self._flush(batch)
+        while not self._queue.empty():
+            await self._flush(self._take(self.batch_size))
+        logger.info(f"Write-behind buffer flushed on shutdown: {self.metrics()}")
+
+    async def enqueue(self, document: Dict[str, Any]):
+        if self._task is None:
+            await self.storage.insert(document)
+            return
+        if self._queue.full():
+            if self.overflow_policy == "drop_newest":
+                self.dropped += 1
+                return
+            if self.overflow_policy == "drop_oldest":
+                self._queue.get_nowait()
+                self.dropped += 1
+        await self._queue.put(document)
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_latency": self.last_flush_latency,
+            "avg_flush_latency": self.total_flush_latency / self.batches if self.batches else 0.0,
+        }
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                self._batch.extend(self._take(self.batch_size - len(self._batch)))
+                timeout = deadline - loop.time()
+                if len(self._batch) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            # Shielded so that stop() can wait for a write already under way
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        for attempt in range(WRITE_MAX_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                await self.storage.insert_many(batch)
+                self._record(len(batch), time.perf_counter() - started)
+                return
+            except PartialWriteError as e:
+                # Unordered inserts write everything they can; retrying would
+                # only duplicate the documents that did succeed.
+                self._record(e.inserted, time.perf_counter() - started)
+                self.failed += len(batch) - e.inserted
+                logger.error(f"Write-behind batch partially failed: {e.errors[:1]}")
+                return
+            except Exception as e:
+                if attempt == WRITE_MAX_RETRIES:
+                    self.failed += len(batch)
+                    logger.error(f"Write-behind batch of {len(batch)} dropped after retries: {e}")
+                    return
+                delay = WRITE_RETRY_BACKOFF * 2 ** attempt
+                logger.error(f"Write-behind flush failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    def _record(self, count: int, latency: float):
+        self.flushed += count
+        self.batches += 1
+        self.last_flush_latency = latency
+        observe_stage("storage", latency)
+        self.total_flush_latency += latency